@@ -1,15 +1,34 @@
 import random
+from array import array
+from collections import deque
 
 HEIGHT = 25
 WIDTH = 25
+MAX_TAIL_LENGTH = WIDTH * HEIGHT
 
 class Agent:
 
+    __slots__ = ("head", "tail")
+
     def __init__(self):
 
         x = random.randint(0, WIDTH-1)
 
         y = random.randint(0, HEIGHT-1)
 
-        self.head = [x,y]
-        self.tail = [[x,y]]
+        # fixed-width int32 coordinates; the tail is capped so memory per env stays constant
+        self.head = array('i', (x, y))
+        self.tail = deque([(x, y)], maxlen=MAX_TAIL_LENGTH)
+
+    def is_at(self, pos):
+        return self.head[0] == pos[0] and self.head[1] == pos[1]
+
+    def grow(self):
+        self.tail.appendleft((self.head[0], self.head[1]))
+
+    def advance_tail(self):
+        # slide the tail one cell behind the head without changing its length
+        full = len(self.tail) == self.tail.maxlen
+        self.tail.appendleft((self.head[0], self.head[1]))
+        if not full:
+            self.tail.pop()
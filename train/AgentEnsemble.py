@@ -0,0 +1,120 @@
+import copy
+
+import torch
+from torch.func import functional_call, stack_module_state, vmap
+
+from ppo_update import ppo_loss
+
+
+def substate(state, prefix):
+    return {name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)}
+
+
+class FunctionalAgent:
+    """
+    The `Agent` interface `ppo_loss` needs, evaluated with one member's
+    parameters through `functional_call`.
+
+    Log-probs and entropy are computed from `log_softmax` directly because
+    `Categorical`'s argument validation branches on data, which `vmap`
+    cannot trace.
+    """
+
+    def __init__(self, agent, state):
+        self.actor_state = substate(state, "actor.")
+        self.critic_state = substate(state, "critic.")
+        self.agent = agent
+
+    def logits_and_value(self, x):
+        logits = functional_call(self.agent.actor, self.actor_state, (x,))
+        value = functional_call(self.agent.critic, self.critic_state, (x,))
+        return logits, value
+
+    def get_action_and_value(self, x, action):
+        logits, value = self.logits_and_value(x)
+        log_probs = torch.log_softmax(logits, dim=-1)
+        logprob = log_probs.gather(-1, action[..., None]).squeeze(-1)
+        entropy = -(log_probs.exp() * log_probs).sum(dim=-1)
+        return action, logprob, entropy, value
+
+
+class AgentEnsemble:
+    """
+    `num_members` independent `Agent`s trained as one batched model.
+
+    The members' parameters are stacked along a new leading axis
+    (`stack_module_state`), so one optimizer over the stacked tensors
+    updates every member, and each forward pass is a single `vmap` over the
+    members. Observations and rollout tensors are laid out member-major:
+    env `i` of a `num_members * envs_per_member` vector env belongs to
+    member `i // envs_per_member`.
+    """
+
+    def __init__(self, agents):
+        self.num_members = len(agents)
+        self.template = copy.deepcopy(agents[0]).to("meta")
+        self.params, self.buffers = stack_module_state(agents)
+
+    def parameters(self):
+        return list(self.params.values())
+
+    def member_logits_and_value(self, params, buffers, x):
+        return FunctionalAgent(self.template, {**params, **buffers}).logits_and_value(x)
+
+    def logits_and_value(self, x):
+        x = x.view(self.num_members, -1, *x.shape[1:])
+        logits, value = vmap(self.member_logits_and_value)(self.params, self.buffers, x)
+        return logits.flatten(0, 1), value.flatten()
+
+    @torch.no_grad()
+    def act(self, x):
+        """Same contract as `Agent.act`: `(action, logprob, value)` for every env."""
+        logits, value = self.logits_and_value(x)
+        # Gumbel-max, as in FusedPolicy
+        noise = torch.rand(logits.shape, device=logits.device).log_().neg_().log_()
+        action = torch.argmax(logits - noise, dim=1)
+        logprob = logits.gather(1, action[:, None]).squeeze(1) - torch.logsumexp(logits, dim=1)
+        return action, logprob, value
+
+    @torch.no_grad()
+    def get_value(self, x):
+        return self.logits_and_value(x)[1]
+
+    def member_loss(self, params, buffers, mb, clip_coef, ent_coef, norm_adv: bool, clip_vloss: bool, vf_coef: float):
+        agent = FunctionalAgent(self.template, {**params, **buffers})
+        return ppo_loss(agent, mb, clip_coef, norm_adv, clip_vloss, ent_coef, vf_coef)
+
+    def loss(self, mb, clip_coefs, ent_coefs, norm_adv, clip_vloss, vf_coef):
+        """
+        Per-member PPO losses for a member-major `Minibatch` (every field
+        `[num_members, minibatch_size, ...]`) and per-member `clip_coefs` and
+        `ent_coefs`. Returns `(losses, stats)` shaped `[num_members]` and
+        `[num_members, len(LOSS_METRICS)]`.
+        """
+        def member_loss(params, buffers, mb, clip_coef, ent_coef):
+            return self.member_loss(params, buffers, mb, clip_coef, ent_coef, norm_adv, clip_vloss, vf_coef)
+
+        return vmap(member_loss)(self.params, self.buffers, mb, clip_coefs, ent_coefs)
+
+    @torch.no_grad()
+    def clip_grad_norm_(self, max_norm):
+        # one norm per member, like running clip_grad_norm_ on each agent on its own
+        grads = [p.grad for p in self.parameters() if p.grad is not None]
+        norms = torch.stack([grad.flatten(1).pow(2).sum(dim=1) for grad in grads]).sum(dim=0).sqrt()
+        scale = torch.clamp(max_norm / (norms + 1e-6), max=1.0)
+        for grad in grads:
+            grad.mul_(scale.view(-1, *([1] * (grad.dim() - 1))))
+        return norms
+
+    def member_state_dict(self, index):
+        """The `Agent.state_dict()` of member `index`."""
+        return {name: value[index] for name, value in {**self.params, **self.buffers}.items()}
+
+    def member_optimizer_state_dict(self, optimizer, index):
+        """Slice an optimizer over `parameters()` into the state an optimizer over one `Agent` would have."""
+        state_dict = optimizer.state_dict()
+        member_state = {
+            key: {name: value[index] if name != "step" and value.dim() > 0 else value for name, value in state.items()}
+            for key, state in state_dict["state"].items()
+        }
+        return {"state": member_state, "param_groups": state_dict["param_groups"]}
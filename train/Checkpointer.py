@@ -0,0 +1,98 @@
+import glob
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def detached_copy(value):
+    """Copy every tensor in a nested state to the CPU, so training can keep mutating the originals."""
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: detached_copy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(detached_copy(item) for item in value)
+    return value
+
+
+def atomic_save(state, path):
+    # write next to the target and rename, so a crash never leaves a truncated checkpoint behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpointer:
+    """
+    Writes numbered checkpoints to `directory` from a background thread.
+
+    `save` copies the state to the CPU before returning, then the write,
+    the atomic rename and the pruning to the last `keep_last` checkpoints
+    happen off the training loop. Writes are queued in order; `close` waits
+    for them.
+    """
+
+    def __init__(self, directory, keep_last=3):
+        self.directory = directory
+        self.keep_last = keep_last
+        os.makedirs(directory, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self.pending = None
+
+    def path(self, iteration):
+        return os.path.join(self.directory, f"checkpoint_{iteration:08d}.pt")
+
+    def save(self, state, iteration):
+        if self.pending is not None:
+            # surface errors from the previous write instead of losing them
+            self.pending.result()
+        self.pending = self.executor.submit(self.write, detached_copy(state), self.path(iteration))
+
+    def write(self, state, path):
+        atomic_save(state, path)
+        for stale in list_checkpoints(self.directory)[:-self.keep_last]:
+            os.remove(stale)
+
+    def close(self):
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+        self.executor.shutdown()
+
+
+def list_checkpoints(directory):
+    # zero-padded iteration numbers sort in order
+    return sorted(glob.glob(os.path.join(directory, "checkpoint_*.pt")))
+
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+
+def load_checkpoint(path, map_location="cpu"):
+    # checkpoints hold Python and NumPy RNG states, which the weights-only loader rejects
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+def rng_state():
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
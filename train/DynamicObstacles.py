@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from operator import add
-
-from gymnasium.spaces import Discrete
+import gymnasium as gym
+import numpy as np
+from gymnasium.spaces import Box, Discrete
 
 from minigrid.core.grid import Grid
 from minigrid.core.mission import MissionSpace
@@ -10,6 +10,10 @@ from minigrid.core.world_object import Ball, Goal
 from minigrid.minigrid_env import MiniGridEnv
 from gymnasium.envs.registration import register
 
+from DynamicObstaclesEngine import DynamicObstaclesEngine
+from EgocentricView import EgocentricView
+from SymbolicView import SymbolicView
+
 
 class DynamicObstaclesEnv(MiniGridEnv):
     """
@@ -68,6 +72,13 @@ class DynamicObstaclesEnv(MiniGridEnv):
     - `MiniGrid-Dynamic-Obstacles-8x8-v0`
     - `MiniGrid-Dynamic-Obstacles-16x16-v0`
 
+    The dynamics run on a single-env `DynamicObstaclesEngine` and the image
+    is read off its occupancy grid by `EgocentricView`; the minigrid grid is
+    kept in sync with it for rendering and wrappers. With
+    `observation_mode="symbolic"` observations are `SymbolicView`'s float32
+    vectors (agent position and direction, goal offset, the `num_nearest`
+    closest obstacle offsets) instead of the image dict.
+
     """
 
     def __init__(
@@ -77,6 +88,8 @@ class DynamicObstaclesEnv(MiniGridEnv):
         agent_start_dir=0,
         n_obstacles=4,
         max_steps: int | None = None,
+        observation_mode: str = "image",
+        num_nearest: int = 4,
         **kwargs,
     ):
         self.agent_start_pos = agent_start_pos
@@ -105,6 +118,14 @@ class DynamicObstaclesEnv(MiniGridEnv):
         self.action_space = Discrete(self.actions.forward + 1)
         self.reward_range = (-1, 1)
 
+        self.engine = DynamicObstaclesEngine(
+            1, size, agent_start_pos, agent_start_dir, self.n_obstacles, self.max_steps
+        )
+        self.view = EgocentricView(1, size, size, self.agent_view_size)
+        self.symbolic_view = SymbolicView(size, self.n_obstacles, num_nearest) if observation_mode == "symbolic" else None
+        if self.symbolic_view is not None:
+            self.observation_space = Box(low=-1, high=1, shape=(self.symbolic_view.size,), dtype=np.float32)
+
     @staticmethod
     def _gen_mission():
         return "get to the green goal square"
@@ -119,56 +140,88 @@ class DynamicObstaclesEnv(MiniGridEnv):
         # Place a goal square in the bottom-right corner
         self.grid.set(width - 2, height - 2, Goal())
 
-        # Place the agent
-        if self.agent_start_pos is not None:
-            self.agent_pos = self.agent_start_pos
-            self.agent_dir = self.agent_start_dir
-        else:
-            self.place_agent()
+        # Agent and obstacles are placed by the engine, drawing from this env's RNG
+        self.engine.np_random = self.np_random
+        self.engine.reset_envs(self.engine.env_indices)
+        self.agent_pos = tuple(int(v) for v in self.engine.agent_pos[0])
+        self.agent_dir = int(self.engine.agent_dir[0])
 
-        # Place obstacles
-        self.obstacles = []
-        for i_obst in range(self.n_obstacles):
-            self.obstacles.append(Ball())
-            self.place_obj(self.obstacles[i_obst], max_tries=100)
+        self.obstacles = [Ball() for _ in range(self.n_obstacles)]
+        for obstacle, pos in zip(self.obstacles, self.engine.obstacles[0]):
+            self.grid.set(pos[0], pos[1], obstacle)
+            obstacle.init_pos = obstacle.cur_pos = tuple(int(v) for v in pos)
 
         self.mission = "get to the green goal square"
 
+    def sync_grid(self):
+        # clear every old cell first, a ball may have moved into another's old cell
+        for obstacle in self.obstacles:
+            self.grid.set(obstacle.cur_pos[0], obstacle.cur_pos[1], None)
+        for obstacle, pos in zip(self.obstacles, self.engine.obstacles[0]):
+            self.grid.set(pos[0], pos[1], obstacle)
+            obstacle.cur_pos = tuple(int(v) for v in pos)
+        self.agent_pos = tuple(int(v) for v in self.engine.agent_pos[0])
+        self.agent_dir = int(self.engine.agent_dir[0])
+        self.step_count = int(self.engine.step_count[0])
+
+    def gen_obs(self):
+        # the image is byte-identical to MiniGridEnv.gen_obs
+        engine = self.engine
+        if self.symbolic_view is not None:
+            return self.symbolic_view(engine.agent_pos, engine.agent_dir, engine.obstacles)[0]
+        image = self.view(engine.grids, engine.agent_pos, engine.agent_dir)[0]
+        return {"image": image, "direction": self.agent_dir, "mission": self.mission}
+
     def step(self, action):
-        # Invalid action
-        if action >= self.action_space.n:
-            action = 0
-
-        # Check if there is an obstacle in front of the agent
-        front_cell = self.grid.get(*self.front_pos)
-        not_clear = front_cell and front_cell.type != "goal"
-
-        # Update obstacle positions
-        for i_obst in range(len(self.obstacles)):
-            old_pos = self.obstacles[i_obst].cur_pos
-            top = tuple(map(add, old_pos, (-1, -1)))
-
-            try:
-                self.place_obj(
-                    self.obstacles[i_obst], top=top, size=(3, 3), max_tries=100
-                )
-                self.grid.set(old_pos[0], old_pos[1], None)
-            except Exception:
-                pass
-
-        # Update the agent's position/direction
-        obs, reward, terminated, truncated, info = super().step(action)
-
-        # If the agent tried to walk over an obstacle or wall
-        if action == self.actions.forward and not_clear:
-            reward = -1
-            terminated = True
-            return obs, reward, terminated, truncated, info
-
-        return obs, reward, terminated, truncated, info
-    
+        # Move the obstacles, then the agent; walking into an obstacle or wall costs -1 and ends the episode
+        reward, terminated, truncated, _ = self.engine.step(np.array([action]))
+        self.sync_grid()
+
+        if self.render_mode == "human":
+            self.render()
+
+        return self.gen_obs(), float(reward[0]), bool(terminated[0]), bool(truncated[0]), {}
+
+
+class FlatObservation(gym.ObservationWrapper):
+    """
+    `DynamicObstaclesEnv` observations as one flat uint8 vector, the image
+    followed by the direction (the layout of `DynamicObstaclesVecEnv`), so
+    the per-env vector envs and `SharedMemoryVecEnv` can batch them. The
+    mission text is dropped.
+    """
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.image_size = int(np.prod(env.observation_space["image"].shape))
+        self.observation_space = Box(low=0, high=255, shape=(self.image_size + 1,), dtype=np.uint8)
+
+    def observation(self, observation):
+        flat = np.empty(self.image_size + 1, dtype=np.uint8)
+        flat[:self.image_size] = observation["image"].reshape(-1)
+        flat[self.image_size] = observation["direction"]
+        return flat
+
 
 register(
     id='DynamicObstacles',
     entry_point='DynamicObstacles:DynamicObstaclesEnv',
-)
\ No newline at end of file
+)
+
+register(
+    id='DynamicObstacles-16x16',
+    entry_point='DynamicObstacles:DynamicObstaclesEnv',
+    kwargs={'size': 16, 'n_obstacles': 8},
+)
+
+register(
+    id='DynamicObstacles-Symbolic',
+    entry_point='DynamicObstacles:DynamicObstaclesEnv',
+    kwargs={'observation_mode': 'symbolic'},
+)
+
+register(
+    id='DynamicObstacles-16x16-Symbolic',
+    entry_point='DynamicObstacles:DynamicObstaclesEnv',
+    kwargs={'size': 16, 'n_obstacles': 8, 'observation_mode': 'symbolic'},
+)
@@ -0,0 +1,190 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+
+# occupancy codes; the agent is not on the grid, it is tracked by position
+EMPTY, WALL, GOAL, BALL = 0, 1, 2, 3
+
+LEFT, RIGHT, FORWARD = 0, 1, 2
+
+# right, down, left, up, in the order of minigrid's DIR_TO_VEC
+DIRECTIONS = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]], dtype=np.int64)
+
+# the 3x3 window around an obstacle without its centre: the ball occupies its own
+# cell, so minigrid's place_obj can never leave it where it is
+NEIGHBOURHOOD = np.array(
+    [[dx, dy] for dx in range(-1, 2) for dy in range(-1, 2) if (dx, dy) != (0, 0)], dtype=np.int64
+)
+
+
+def sample_cells(free, keys):
+    """
+    For every row of the bool mask `free`, the column of a uniformly drawn
+    `True` entry: the one with the largest of the i.i.d. `keys` (same shape,
+    uniform in [0, 1)). Rows without a free entry return -1.
+    """
+    choice = np.where(free, keys, -1.0).argmax(axis=1)
+    return np.where(free[np.arange(len(free)), choice], choice, -1)
+
+
+class DynamicObstaclesEngine:
+    """
+    Array-based state and dynamics of `DynamicObstaclesEnv` for `num_envs`
+    environments at once.
+
+    Every env has a `(width, height)` occupancy grid of the codes above
+    (walls and goal are fixed, balls move), its obstacle positions as an
+    `(n_obstacles, 2)` slice of `obstacles`, and the agent's position,
+    direction and step count. Cells are indexed `[x, y]` like minigrid's
+    `Grid.get`.
+
+    Obstacles move like `place_obj(ball, top=pos - 1, size=(3, 3))`: one by
+    one, each to a uniformly drawn cell of its 3x3 neighbourhood that is
+    empty and not the agent's, seeing the moves of the obstacles before it,
+    and staying put when there is none. The neighbour cells come from a
+    precomputed table, and one call to the RNG draws a random key for every
+    candidate cell of every obstacle in every env; the free candidate with
+    the largest key is a uniform pick. minigrid gives up after 100 rejected
+    tries; with at most eight candidates that only differs with probability
+    below 1e-5.
+
+    `step` does not reset finished envs; callers reset them with
+    `reset_envs`.
+    """
+
+    def __init__(
+        self,
+        num_envs: int = 1,
+        size: int = 8,
+        agent_start_pos=(1, 1),
+        agent_start_dir: int = 0,
+        n_obstacles: int = 4,
+        max_steps: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.num_envs = num_envs
+        self.width = self.height = size
+        self.agent_start_pos = agent_start_pos
+        self.agent_start_dir = agent_start_dir
+        # same cap as DynamicObstaclesEnv
+        self.n_obstacles = int(n_obstacles) if n_obstacles <= size / 2 + 1 else int(size / 2)
+        self.max_steps = max_steps if max_steps is not None else 4 * size**2
+
+        self.np_random = np.random.default_rng(seed)
+        self.env_indices = np.arange(num_envs)
+
+        background = np.zeros((size, size), dtype=np.uint8)
+        background[[0, -1], :] = WALL
+        background[:, [0, -1]] = WALL
+        background[size - 2, size - 2] = GOAL
+        self.background = background.reshape(-1)
+
+        # flat ids of every cell's eight neighbours (clipped at the border, where only walls are)
+        cells = np.arange(size * size)
+        x, y = cells // size, cells % size
+        nx = np.clip(x[:, None] + NEIGHBOURHOOD[:, 0], 0, size - 1)
+        ny = np.clip(y[:, None] + NEIGHBOURHOOD[:, 1], 0, size - 1)
+        self.neighbours = nx * size + ny
+
+        self.grids = np.zeros((num_envs, size, size), dtype=np.uint8)
+        self.flat_grids = self.grids.reshape(num_envs, -1)
+        self.obstacles = np.zeros((num_envs, self.n_obstacles, 2), dtype=np.int64)
+        self.agent_pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.agent_dir = np.zeros(num_envs, dtype=np.int64)
+        self.step_count = np.zeros(num_envs, dtype=np.int64)
+
+        self.reset_envs(self.env_indices)
+
+    def cell(self, pos):
+        return pos[..., 0] * self.height + pos[..., 1]
+
+    def position(self, cell):
+        return np.stack(np.divmod(cell, self.height), axis=-1)
+
+    def reset_envs(self, idx):
+        count = len(idx)
+        self.flat_grids[idx] = self.background
+        self.step_count[idx] = 0
+
+        if self.agent_start_pos is not None:
+            self.agent_pos[idx] = self.agent_start_pos
+            self.agent_dir[idx] = self.agent_start_dir
+        else:
+            free = self.flat_grids[idx] == EMPTY
+            self.agent_pos[idx] = self.position(sample_cells(free, self.np_random.random(free.shape)))
+            self.agent_dir[idx] = self.np_random.integers(0, 4, count)
+
+        agent_cell = self.cell(self.agent_pos[idx])
+        keys = self.np_random.random((self.n_obstacles, count, self.width * self.height))
+        for k in range(self.n_obstacles):
+            free = self.flat_grids[idx] == EMPTY
+            free[np.arange(count), agent_cell] = False
+            cell = sample_cells(free, keys[k])
+            self.flat_grids[idx, cell] = BALL
+            self.obstacles[idx, k] = self.position(cell)
+
+    def move_obstacles(self):
+        rows = self.env_indices
+        agent_cell = self.cell(self.agent_pos)[:, None]
+        cells = self.cell(self.obstacles)
+        keys = self.np_random.random((self.num_envs, self.n_obstacles, len(NEIGHBOURHOOD)))
+        for k in range(self.n_obstacles):
+            old = cells[:, k]
+            candidates = self.neighbours[old]
+            free = (self.flat_grids[rows[:, None], candidates] == EMPTY) & (candidates != agent_cell)
+            choice = sample_cells(free, keys[:, k])
+            # boxed-in obstacles stay where they are
+            new = np.where(choice >= 0, candidates[rows, choice], old)
+            self.flat_grids[rows, old] = EMPTY
+            self.flat_grids[rows, new] = BALL
+            cells[:, k] = new
+        self.obstacles[:] = self.position(cells)
+
+    def step(self, actions):
+        """
+        Advance every env by one `DynamicObstaclesEnv.step`. Returns
+        `(reward, terminated, truncated, collided)` arrays.
+        """
+        idx = self.env_indices
+        actions = np.asarray(actions, dtype=np.int64)
+        # invalid actions turn left, like DynamicObstaclesEnv
+        actions = np.where(actions > FORWARD, LEFT, actions)
+        forward = actions == FORWARD
+
+        # a wall or ball in front before the obstacles move is a collision, even if the ball moves away
+        front = self.cell(self.agent_pos + DIRECTIONS[self.agent_dir])
+        front_code = self.flat_grids[idx, front]
+        collided = forward & ((front_code == WALL) | (front_code == BALL))
+
+        self.move_obstacles()
+        self.step_count += 1
+        self.agent_dir = (self.agent_dir + (actions == RIGHT) - (actions == LEFT)) % 4
+
+        # the move itself sees the obstacles' new cells
+        front_code = self.flat_grids[idx, front]
+        walks = forward & ((front_code == EMPTY) | (front_code == GOAL))
+        self.agent_pos[walks] = self.position(front[walks])
+        reached = forward & (front_code == GOAL)
+
+        reward = np.where(reached, 1 - 0.9 * (self.step_count / self.max_steps), 0.0)
+        reward[collided] = -1.0
+        terminated = reached | collided
+        truncated = self.step_count >= self.max_steps
+        return reward, terminated, truncated, collided
+
+
+if __name__ == "__main__":
+    # steps per second of the 16x16 variant, batched
+    for num_envs in (1, 64, 1024):
+        engine = DynamicObstaclesEngine(num_envs, size=16, n_obstacles=8, seed=0)
+        rng = np.random.default_rng(0)
+        num_steps = 200
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            _, terminated, truncated, _ = engine.step(rng.integers(0, 3, num_envs))
+            finished = np.flatnonzero(terminated | truncated)
+            if len(finished):
+                engine.reset_envs(finished)
+        print(f"{num_envs:5d} envs: {num_envs * num_steps / (time.perf_counter() - start):10.0f} steps/s")
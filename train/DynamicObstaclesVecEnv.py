@@ -0,0 +1,106 @@
+import gymnasium as gym
+from gymnasium import spaces
+
+import numpy as np
+
+from SameStepVecEnv import SameStepVecEnv
+from DynamicObstaclesEngine import DynamicObstaclesEngine
+from EgocentricView import EgocentricView
+from SymbolicView import SymbolicView
+from typing import Literal, Optional
+
+
+VIEW_SIZE = 7
+IMAGE_SIZE = VIEW_SIZE * VIEW_SIZE * 3
+
+
+class DynamicObstaclesVecEnv(SameStepVecEnv):
+    """
+    Batch engine for `DynamicObstaclesEnv` with flat observations.
+
+    `num_envs` environments step together on a `DynamicObstaclesEngine`.
+    Every observation is the minigrid image, flattened, followed by the
+    agent's direction; the mission text is dropped. `EgocentricView` writes
+    the images straight into the preallocated `(num_envs, IMAGE_SIZE + 1)`
+    uint8 `observation` buffer, and the policy converts it to float once
+    per batch. `DynamicObstacles.FlatObservation` gives single envs the same
+    layout.
+
+    Finished environments are reset in place during the same `step` call (see
+    `SameStepVecEnv`). `infos["goal"]` and `infos["collision"]` flag the envs
+    that reached the goal or walked into an obstacle or wall on this step.
+    """
+
+    def __init__(
+        self,
+        num_envs: int = 16,
+        seed: Optional[int] = None,
+        size: int = 8,
+        n_obstacles: int = 4,
+        agent_start_pos=(1, 1),
+        agent_start_dir: int = 0,
+        max_steps: Optional[int] = None,
+        observation_mode: Literal["image", "symbolic"] = "image",
+        num_nearest: int = 4,
+    ):
+        self.num_envs = num_envs
+        self.closed = False
+        self.render_mode = None
+
+        self.single_action_space = spaces.Discrete(3)
+        self.engine = DynamicObstaclesEngine(
+            num_envs, size, agent_start_pos, agent_start_dir, n_obstacles, max_steps, seed
+        )
+        self.env_indices = self.engine.env_indices
+        self.symbolic = observation_mode == "symbolic"
+        if self.symbolic:
+            self.view = SymbolicView(size, self.engine.n_obstacles, num_nearest)
+            self.single_observation_space = spaces.Box(low=-1, high=1, shape=(self.view.size,), dtype=np.float32)
+        else:
+            self.view = EgocentricView(num_envs, size, size, VIEW_SIZE)
+            self.single_observation_space = spaces.Box(low=0, high=255, shape=(IMAGE_SIZE + 1,), dtype=np.uint8)
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+
+        self.observation = np.zeros(self.observation_space.shape, dtype=self.single_observation_space.dtype)
+        if not self.symbolic:
+            # a strided view of the buffer's image columns, for EgocentricView to fill in place
+            self.images = self.observation[:, :IMAGE_SIZE].reshape(num_envs, VIEW_SIZE, VIEW_SIZE, 3)
+
+        self.observe()
+
+    def observe(self, idx=None):
+        engine = self.engine
+        if self.symbolic:
+            if idx is None:
+                self.view(engine.agent_pos, engine.agent_dir, engine.obstacles, out=self.observation)
+            else:
+                self.observation[idx] = self.view(engine.agent_pos[idx], engine.agent_dir[idx], engine.obstacles[idx])
+        elif idx is None:
+            self.view(engine.grids, engine.agent_pos, engine.agent_dir, out=self.images)
+            self.observation[:, IMAGE_SIZE] = engine.agent_dir
+        else:
+            images = self.view(engine.grids[idx], engine.agent_pos[idx], engine.agent_dir[idx])
+            self.observation[idx, :IMAGE_SIZE] = images.reshape(len(idx), IMAGE_SIZE)
+            self.observation[idx, IMAGE_SIZE] = engine.agent_dir[idx]
+
+    def reset_envs(self, idx):
+        self.engine.reset_envs(idx)
+        self.observe(idx)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.engine.np_random = np.random.default_rng(seed)
+
+        self.engine.reset_envs(self.env_indices)
+        self.observe()
+
+        return self.observation.copy(), {}
+
+    def step(self, actions):
+        reward, terminated, truncated, collided = self.engine.step(actions)
+        self.observe()
+
+        infos = self.autoreset(terminated | truncated, {"goal": terminated & ~collided, "collision": collided})
+
+        return self.observation.copy(), reward, terminated, truncated, infos
@@ -0,0 +1,74 @@
+import numpy as np
+from minigrid.core.constants import COLOR_TO_IDX, OBJECT_TO_IDX
+
+from DynamicObstaclesEngine import BALL, EMPTY, GOAL, WALL
+
+
+# minigrid's (OBJECT_IDX, COLOR_IDX, STATE) encoding of every occupancy code
+ENCODING = np.zeros((4, 3), dtype=np.uint8)
+ENCODING[EMPTY] = (OBJECT_TO_IDX["empty"], 0, 0)
+ENCODING[WALL] = (OBJECT_TO_IDX["wall"], COLOR_TO_IDX["grey"], 0)
+ENCODING[GOAL] = (OBJECT_TO_IDX["goal"], COLOR_TO_IDX["green"], 0)
+ENCODING[BALL] = (OBJECT_TO_IDX["ball"], COLOR_TO_IDX["blue"], 0)
+
+
+def view_offsets(view_size, direction):
+    """
+    `(view_size, view_size, 2)` offsets from the agent of the cells in
+    minigrid's view, indexed like the observation image: the
+    `get_view_exts` square, turned by `Grid.rotate_left` `direction + 1` times.
+    """
+    half = view_size // 2
+    top = [(0, -half), (-half, 0), (1 - view_size, -half), (-half, 1 - view_size)][direction]
+    i, j = np.meshgrid(np.arange(view_size), np.arange(view_size), indexing="ij")
+    view = np.stack([top[0] + i, top[1] + j], axis=-1)
+    for _ in range(direction + 1):
+        # rotate_left: new[a, b] = old[size - 1 - b, a]
+        view = view[::-1].transpose(1, 0, 2)
+    return view
+
+
+class EgocentricView:
+    """
+    minigrid's partially observable `image` (`gen_obs` with
+    `see_through_walls=True` and nothing carried) for a batch of
+    `DynamicObstaclesEngine` occupancy grids, without per-cell objects.
+
+    The grids are copied once per call into a uint8 code array padded with
+    `view_size - 1` walls, so every view is in bounds (minigrid shows walls
+    off the grid). Each agent's view is then one gather through the
+    flat-offset table of its direction, built once here, and one lookup
+    into `ENCODING`. The agent's own cell always reads as empty, like in
+    `gen_obs_grid`.
+    """
+
+    def __init__(self, num_envs, width, height, view_size=7):
+        self.view_size = view_size
+        self.pad = view_size - 1
+        self.padded = np.full((num_envs, width + 2 * self.pad, height + 2 * self.pad), WALL, dtype=np.uint8)
+        self.flat_padded = self.padded.reshape(num_envs, -1)
+        self.padded_height = height + 2 * self.pad
+
+        # [direction, view cell] -> flat offset from the agent's cell in `padded`
+        offsets = [view_offsets(view_size, direction) for direction in range(4)]
+        self.offsets = np.stack([(view[..., 0] * self.padded_height + view[..., 1]).reshape(-1) for view in offsets])
+        self.agent_index = (view_size // 2) * view_size + view_size - 1
+
+    def __call__(self, grids, agent_pos, agent_dir, out=None):
+        """
+        Images for `len(grids)` envs: `grids` `(n, width, height)` codes,
+        `agent_pos` `(n, 2)`, `agent_dir` `(n,)`. Returns (or fills `out`
+        with) `(n, view_size, view_size, 3)` uint8.
+        """
+        count = len(grids)
+        pad = self.pad
+        self.padded[:count, pad:-pad, pad:-pad] = grids
+
+        centre = (agent_pos[:, 0] + pad) * self.padded_height + agent_pos[:, 1] + pad
+        codes = self.flat_padded[np.arange(count)[:, None], centre[:, None] + self.offsets[agent_dir]]
+        codes[:, self.agent_index] = EMPTY
+
+        if out is None:
+            return ENCODING[codes].reshape(count, self.view_size, self.view_size, 3)
+        np.take(ENCODING, codes, axis=0, out=out.reshape(count, -1, 3))
+        return out
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class FreeCellSampler:
+    """
+    Compact index of the cells an apple may spawn on, one row per layout.
+
+    The spawn region is `[1, width) x [1, height)`. For every layout `cells`
+    holds the region's cell ids with the `count` free ones first, and `slots`
+    is the inverse permutation, so a draw is one index into `cells` no matter
+    how dense the obstacles are. Draws are batched over layouts and take
+    uniforms in [0, 1) from the caller, so the owning env keeps its own RNG.
+    """
+
+    def __init__(self, num_layouts, width, height):
+        self.width = width
+        self.height = height
+        self.num_cells = (width - 1) * (height - 1)
+
+        self.cells = np.tile(np.arange(self.num_cells, dtype=np.int64), (num_layouts, 1))
+        self.slots = self.cells.copy()
+        self.count = np.full(num_layouts, self.num_cells, dtype=np.int64)
+
+    def rebuild(self, idx, blocked):
+        """Re-index layouts `idx` from `blocked`, a (len(idx), width-1, height-1) bool mask."""
+        blocked = blocked.reshape(len(idx), self.num_cells)
+        order = np.argsort(blocked, axis=1, kind="stable")
+
+        self.cells[idx] = order
+        self.slots[idx[:, None], order] = np.arange(self.num_cells)
+        self.count[idx] = self.num_cells - blocked.sum(axis=1)
+
+    def sample(self, idx, uniforms, avoid):
+        """
+        Draw one free cell per layout in `idx`, never the `avoid` cell (one
+        `[x, y]` per layout, typically the agent's head). Returns `(x, y)` arrays.
+        """
+        x, y = avoid[:, 0], avoid[:, 1]
+        inside = (x >= 1) & (x < self.width) & (y >= 1) & (y < self.height)
+        avoid_cell = np.where(inside, (x - 1) * (self.height - 1) + (y - 1), 0)
+
+        count = self.count[idx]
+        avoid_slot = self.slots[idx, avoid_cell]
+        avoided = inside & (avoid_slot < count)
+
+        # draw among the first count-1 slots when the avoided cell is free and
+        # swap it for the last free slot if it comes up
+        choices = count - avoided
+        pick = np.minimum((uniforms * choices).astype(np.int64), choices - 1)
+        pick = np.where(avoided & (pick == avoid_slot), count - 1, pick)
+
+        cell = self.cells[idx, pick]
+        return cell // (self.height - 1) + 1, cell % (self.height - 1) + 1
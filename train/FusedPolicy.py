@@ -0,0 +1,122 @@
+import time
+
+import torch
+
+
+class FusedPolicy:
+    """
+    Single-pass rollout inference for an `Agent`'s actor and critic.
+
+    Both MLPs have the same shape and share their input, so their weights are
+    stacked along a leading axis of size two and every layer runs as one
+    `baddbmm` for actor and critic together; the critic's single output is
+    zero-padded to the actor's width. The action is drawn with the
+    Gumbel-max trick straight from the logits, so no `Categorical` object is
+    built per step.
+
+    With image encoders (`--encoder cnn`) each head's encoder runs on its
+    own and their features are stacked as the MLPs' input instead.
+
+    The stacked weights are rebuilt lazily whenever a parameter changes
+    (optimizer step, `load_state_dict`, `.to(device)`), so the policy always
+    matches the agent it wraps.
+    """
+
+    def __init__(self, agent):
+        self.normalize = agent.actor.obs_rms
+        self.encoders = (agent.actor.encoder, agent.critic.encoder)
+        self.shared_input = all(isinstance(encoder, torch.nn.Identity) for encoder in self.encoders)
+        self.actor_layers = [agent.actor.actor[i] for i in (0, 2, 4)]
+        self.critic_layers = [agent.critic.critic[i] for i in (0, 2, 4)]
+        self.parameters = [p for layer in self.actor_layers + self.critic_layers for p in (layer.weight, layer.bias)]
+        self.num_actions = self.actor_layers[-1].out_features
+        self.key = None
+
+    def parameters_key(self):
+        return tuple((p.data_ptr(), p._version) for p in self.parameters)
+
+    @torch.no_grad()
+    def sync(self):
+        self.weights, self.biases = [], []
+        for actor_layer, critic_layer in zip(self.actor_layers, self.critic_layers):
+            weight = actor_layer.weight.new_zeros((2, actor_layer.in_features, actor_layer.out_features))
+            bias = actor_layer.bias.new_zeros((2, 1, actor_layer.out_features))
+            # stored transposed so every layer is a plain `baddbmm(bias, x, weight)`
+            weight[0] = actor_layer.weight.t()
+            weight[1, :, :critic_layer.out_features] = critic_layer.weight.t()
+            bias[0, 0] = actor_layer.bias
+            bias[1, 0, :critic_layer.out_features] = critic_layer.bias
+            self.weights.append(weight)
+            self.biases.append(bias)
+        self.key = self.parameters_key()
+
+    @torch.no_grad()
+    def logits_and_value(self, x):
+        if self.key != self.parameters_key():
+            self.sync()
+        x = self.normalize(x)
+        x = x.expand(2, -1, -1) if self.shared_input else torch.stack([encoder(x) for encoder in self.encoders])
+        hidden = torch.tanh(torch.baddbmm(self.biases[0], x, self.weights[0]))
+        hidden = torch.tanh(torch.baddbmm(self.biases[1], hidden, self.weights[1]))
+        out = torch.baddbmm(self.biases[2], hidden, self.weights[2])
+        return out[0], out[1, :, 0]
+
+    @torch.no_grad()
+    def __call__(self, x, generator=None):
+        """Return `(action, logprob, value)` for a batch of observations."""
+        logits, value = self.logits_and_value(x)
+        # -log(-log(U)) is Gumbel(0, 1); rand + two logs is much cheaper than exponential_ on CPU
+        noise = torch.rand(logits.shape, generator=generator, device=logits.device).log_().neg_().log_()
+        action = torch.argmax(logits - noise, dim=1)
+        logprob = logits.gather(1, action[:, None]).squeeze(1) - torch.logsumexp(logits, dim=1)
+        return action, logprob, value
+
+
+if __name__ == "__main__":
+    # parity and timing check against Agent.get_action_and_value: python FusedPolicy.py
+    from torch.distributions.categorical import Categorical
+
+    from LevelTwoVecEnv import LevelTwoVecEnv
+    from ppo import Agent
+
+    torch.manual_seed(0)
+    envs = LevelTwoVecEnv(num_envs=1)
+    agent = Agent(envs)
+    # move the output layers off their near-zero init so the check means something
+    with torch.no_grad():
+        agent.actor.actor[4].weight.normal_()
+    fused = FusedPolicy(agent)
+
+    for num_envs in [1, 16, 256, 4096]:
+        x = torch.rand(num_envs, envs.single_observation_space.shape[0])
+        logits, value = fused.logits_and_value(x)
+        ref_logits, ref_value = agent.actor(x), agent.critic(x).flatten()
+        assert torch.allclose(logits, ref_logits, atol=1e-5) and torch.allclose(value, ref_value, atol=1e-5)
+
+        action, logprob, fused_value = fused(x)
+        ref_logprob = Categorical(logits=ref_logits).log_prob(action)
+        assert torch.allclose(logprob, ref_logprob, atol=1e-5) and torch.equal(value, fused_value)
+
+        timings = {}
+        for name, fn in [("reference", lambda: agent.get_action_and_value(x)), ("fused", lambda: fused(x))]:
+            with torch.no_grad():
+                fn()
+                start = time.perf_counter()
+                for _ in range(1000):
+                    fn()
+            timings[name] = (time.perf_counter() - start) / 1000
+        print(f"num_envs={num_envs} reference={timings['reference'] * 1e6:.0f}us fused={timings['fused'] * 1e6:.0f}us")
+
+    # Gumbel-max draws follow softmax(logits)
+    x = torch.rand(1, envs.single_observation_space.shape[0]).expand(200_000, -1)
+    action, _, _ = fused(x)
+    frequencies = torch.bincount(action, minlength=fused.num_actions).float() / len(action)
+    expected = torch.softmax(agent.actor(x[:1]), dim=1).flatten()
+    print(f"sampled={frequencies.tolist()} expected={expected.tolist()}")
+    assert torch.allclose(frequencies, expected, atol=5e-3)
+
+    # the merged weights follow in-place parameter updates
+    with torch.no_grad():
+        agent.critic.critic[4].bias.add_(1.0)
+    assert torch.allclose(fused.logits_and_value(x[:1])[1], agent.critic(x[:1]).flatten(), atol=1e-5)
+    print("parity ok")
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+CELL_SIZE = 15
+# the old pygame loop drew the grid from y = 75 down, leaving the top five rows without lines
+GRID_TOP = 75
+GRID_COLOUR = (25, 25, 25)
+
+
+class GridRenderer:
+    """
+    NumPy rasterizer for the `rgb_array` frames of `LevelOneEnv` and
+    `LevelTwoEnv`, pixel-identical to their former pygame drawing.
+
+    The static background (black, with the grid lines) is rendered once.
+    Every frame starts as a copy of it in a reused buffer, and each painted
+    cell is one slice assignment of a cached 15x15 tile: the cell's colour
+    with the grid line border on top, since pygame drew the lines last.
+    Cells off the board are skipped, like the off-surface rects pygame
+    clipped. Frames are indexed `[x, y]`, like `pygame.surfarray.array3d`.
+    """
+
+    def __init__(self, width, height, cell_size=CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+
+        # a cell's 1px border
+        offsets = np.arange(cell_size)
+        edge = (offsets == 0) | (offsets == cell_size - 1)
+        self.border = edge[:, None] | edge[None, :]
+
+        self.background = np.zeros((width * cell_size, height * cell_size, 3), dtype=np.uint8)
+        # (x cell, y cell, x offset, y offset, channel) view of the lined rows
+        lined = self.background[:, GRID_TOP:].reshape(width, cell_size, -1, cell_size, 3).transpose(0, 2, 1, 3, 4)
+        lined[:, :, self.border] = GRID_COLOUR
+        self.frame = self.background.copy()
+        # colour -> (tile without lines, tile with lines)
+        self.tiles = {}
+
+    def tile(self, colour, lined):
+        if colour not in self.tiles:
+            plain = np.empty((self.cell_size, self.cell_size, 3), dtype=np.uint8)
+            plain[:] = colour
+            with_lines = plain.copy()
+            with_lines[self.border] = GRID_COLOUR
+            self.tiles[colour] = (plain, with_lines)
+        return self.tiles[colour][lined]
+
+    def clear(self):
+        np.copyto(self.frame, self.background)
+
+    def paint(self, positions, colour):
+        """Paint the `[x, y]` cells in `positions` (any iterable of pairs) on the board."""
+        size = self.cell_size
+        for x, y in positions:
+            if 0 <= x < self.width and 0 <= y < self.height:
+                self.frame[x * size:(x + 1) * size, y * size:(y + 1) * size] = self.tile(colour, y * size >= GRID_TOP)
+
+    def paint_mask(self, mask, colour):
+        """Paint every cell where the `(width, height)` bool `mask` is set."""
+        self.paint(np.argwhere(mask).tolist(), colour)
+
+    def render(self):
+        # a fresh array per frame, RecordVideo keeps them
+        return self.frame.copy()
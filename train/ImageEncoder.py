@@ -0,0 +1,42 @@
+import torch
+import torch.nn as nn
+
+
+NUM_DIRECTIONS = 4
+
+
+class ImageEncoder(nn.Module):
+    """
+    Small CNN for flat `image + direction` observations
+    (`DynamicObstaclesVecEnv`, `DynamicObstacles.FlatObservation`).
+
+    The `view_size x view_size x 3` minigrid image goes through three 2x2
+    convolutions, with a max-pool after the first, and the one-hot direction
+    is appended; `out_features` is the width of the result. It reads the raw
+    cell codes, so it is not combined with observation normalization.
+    """
+
+    def __init__(self, obs_size):
+        super().__init__()
+        self.view_size = round(((obs_size - 1) / 3) ** 0.5)
+        assert 3 * self.view_size**2 + 1 == obs_size, f"expected a flat image + direction observation, got {obs_size} values"
+        self.conv = nn.Sequential(
+            nn.Conv2d(3, 16, 2),
+            nn.ReLU(),
+            nn.MaxPool2d(2),
+            nn.Conv2d(16, 32, 2),
+            nn.ReLU(),
+            nn.Conv2d(32, 64, 2),
+            nn.ReLU(),
+            nn.Flatten(),
+        )
+        with torch.no_grad():
+            conv_features = self.conv(torch.zeros(1, 3, self.view_size, self.view_size)).shape[1]
+        self.out_features = conv_features + NUM_DIRECTIONS
+
+    def forward(self, x):
+        image = x[:, :-1].reshape(-1, self.view_size, self.view_size, 3).permute(0, 3, 1, 2)
+        # a comparison rather than F.one_hot, which checks its input and cannot run under vmap
+        directions = torch.arange(NUM_DIRECTIONS, device=x.device, dtype=x.dtype)
+        direction = (x[:, -1:] == directions).to(x.dtype)
+        return torch.cat([self.conv(image), direction], dim=1)
@@ -6,6 +6,7 @@ import random
 import numpy as np
 
 from Agent import Agent
+from GridRenderer import GridRenderer
 from gymnasium.envs.registration import register
 from typing import Optional, Union
 
@@ -23,6 +24,7 @@ class LevelOneEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         self.metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 30}
 
         self.screen = None
+        self.renderer = None
 
         self.done = False 
         self.run = True
@@ -69,9 +71,9 @@ class LevelOneEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         if self.Agent.head[1] < 0 or self.Agent.head[0] < 0 or self.Agent.head[1] > HEIGHT or self.Agent.head[0] > WIDTH:
             self.done = True
 
-        if self.Apple == self.Agent.head:
+        if self.Agent.is_at(self.Apple):
 
-            self.Agent.tail.insert(0,list(self.Agent.head))
+            self.Agent.grow()
             self.Apple = get_random_apple()
             self.distance = np.linalg.norm(np.array([self.Agent.head[0], self.Agent.head[1]]) - np.array([self.Apple[0], self.Apple[1]]))
 
@@ -108,8 +110,7 @@ class LevelOneEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
             for pos in self.Agent.tail:
                 pygame.draw.rect(self.screen, (0,0,120), [pos[0], pos[1], 15,15])
 
-            self.Agent.tail.insert(0,list(self.Agent.head))
-            self.Agent.tail.pop()
+            self.Agent.advance_tail()
 
             blockSize = 15
             for x in range(0, 1200, blockSize):
@@ -125,26 +126,16 @@ class LevelOneEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
                     self.close()
 
         elif self.render_mode == 'rgb_array':
-            if self.screen is None:
-                self.screen = pygame.Surface((WIDTH*15, HEIGHT*15))
-            
-            self.screen.fill((0, 0, 0))
-            pygame.draw.rect(self.screen, (255, 0, 0), [self.Apple[0]*15, self.Apple[1]*15, 15, 15])
+            if self.renderer is None:
+                self.renderer = GridRenderer(WIDTH, HEIGHT)
 
-            for pos in self.Agent.tail:
-                pygame.draw.rect(self.screen, (0, 0, 120), [pos[0]*15, pos[1]*15, 15, 15])
-
-            self.Agent.tail.insert(0, list(self.Agent.head*15))
-            self.Agent.tail.pop()
+            self.renderer.clear()
+            self.renderer.paint([self.Apple], (255, 0, 0))
+            self.renderer.paint(self.Agent.tail, (0, 0, 120))
 
-            blockSize = 15
-            for x in range(0, 1200, blockSize):
-                for y in range(75, 800, blockSize):
-                    rect = pygame.Rect(x, y, blockSize, blockSize)
-                    pygame.draw.rect(self.screen, (25, 25, 25), rect, 1)
+            self.Agent.advance_tail()
 
-            rgb_array = pygame.surfarray.array3d(self.screen)
-            return rgb_array
+            return self.renderer.render()
     
     def close(self):
         if self.screen is not None:
@@ -0,0 +1,127 @@
+import gymnasium as gym
+from gymnasium import spaces
+
+import numpy as np
+
+from SameStepVecEnv import SameStepVecEnv
+from LevelOneEnv import HEIGHT, WIDTH
+from typing import Optional
+
+
+# left, up, right, down
+MOVES = np.array([[-1, 0], [0, -1], [1, 0], [0, 1]], dtype=np.int64)
+
+# uniforms pre-drawn per env; a row is refilled from its own generator when used up
+RANDOM_POOL_SIZE = 64
+
+
+class LevelOneVecEnv(SameStepVecEnv):
+    """
+    Array-based batch engine for `LevelOneEnv`.
+
+    Heads and apples of all `num_envs` environments are integer arrays, so
+    distance deltas, termination and apple respawn are array operations. Every
+    environment owns an `np.random.Generator` (spawned from the reset seed),
+    which keeps each env's stream independent of how many others run beside it.
+
+    Finished environments are reset in place during the same `step` call (see
+    `SameStepVecEnv`). `infos["apple"]` and `infos["collision"]` flag the
+    envs that ate an apple or left the board on this step.
+    """
+
+    def __init__(self, num_envs: int = 16, seed: Optional[int] = None):
+        self.num_envs = num_envs
+        self.closed = False
+        self.render_mode = None
+
+        self.single_action_space = spaces.Discrete(4)
+        self.single_observation_space = spaces.Box(low=0, high=WIDTH, shape=(5,), dtype=np.float32)
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+
+        self.env_indices = np.arange(num_envs)
+
+        self.heads = np.zeros((num_envs, 2), dtype=np.int64)
+        self.apples = np.zeros((num_envs, 2), dtype=np.int64)
+        self.distance = np.zeros(num_envs, dtype=np.float64)
+
+        self.random_pool = np.zeros((num_envs, RANDOM_POOL_SIZE), dtype=np.float64)
+        self.random_cursor = np.zeros(num_envs, dtype=np.int64)
+
+        self.observation = np.zeros((num_envs, 5), dtype=np.float32)
+
+        self.seed_generators(seed)
+        self.reset_envs(self.env_indices)
+
+    def seed_generators(self, seed):
+        seeds = np.random.SeedSequence(seed).spawn(self.num_envs)
+        self.generators = [np.random.default_rng(s) for s in seeds]
+        # force a refill so no uniforms from the previous streams are reused
+        self.random_cursor[:] = RANDOM_POOL_SIZE
+
+    def draw(self, idx, count):
+        """Take `count` uniforms in [0, 1) from each env in `idx`, shape (len(idx), count)."""
+        empty = idx[self.random_cursor[idx] + count > RANDOM_POOL_SIZE]
+        for env in empty:
+            self.random_pool[env] = self.generators[env].random(RANDOM_POOL_SIZE)
+        self.random_cursor[empty] = 0
+
+        columns = self.random_cursor[idx, None] + np.arange(count)
+        self.random_cursor[idx] += count
+        return self.random_pool[idx[:, None], columns]
+
+    def get_distance(self, idx):
+        delta = self.heads[idx] - self.apples[idx]
+        return np.sqrt((delta * delta).sum(axis=1))
+
+    def get_random_apple(self, idx):
+        # same range as LevelOneEnv.get_random_apple: [1, WIDTH) x [1, HEIGHT)
+        u = self.draw(idx, 2)
+        self.apples[idx, 0] = 1 + (u[:, 0] * (WIDTH - 1)).astype(np.int64)
+        self.apples[idx, 1] = 1 + (u[:, 1] * (HEIGHT - 1)).astype(np.int64)
+
+    def observe(self, idx):
+        # [[x, y], [target_x, target_y], distance]
+        self.observation[idx, 0:2] = self.heads[idx]
+        self.observation[idx, 2:4] = self.apples[idx]
+        self.observation[idx, 4] = self.distance[idx]
+
+    def reset_envs(self, idx):
+        u = self.draw(idx, 2)
+        self.heads[idx, 0] = (u[:, 0] * WIDTH).astype(np.int64)
+        self.heads[idx, 1] = (u[:, 1] * HEIGHT).astype(np.int64)
+        self.get_random_apple(idx)
+        self.distance[idx] = self.get_distance(idx)
+        self.observe(idx)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.seed_generators(seed)
+
+        self.reset_envs(self.env_indices)
+
+        return self.observation.copy(), {}
+
+    def step(self, actions):
+        idx = self.env_indices
+        actions = np.asarray(actions, dtype=np.int64)
+
+        self.heads += MOVES[actions]
+        x, y = self.heads[:, 0], self.heads[:, 1]
+
+        current_distance = self.get_distance(idx)
+        reward = np.where(current_distance < self.distance, 1.0, -0.5)
+        self.distance = current_distance
+        self.observe(idx)
+
+        done = (x < 0) | (y < 0) | (x > WIDTH) | (y > HEIGHT)
+
+        ate_mask = (self.apples == self.heads).all(axis=1)
+        ate = np.flatnonzero(ate_mask)
+        if len(ate):
+            self.get_random_apple(ate)
+            self.distance[ate] = self.get_distance(ate)
+
+        infos = self.autoreset(done, {"apple": ate_mask, "collision": done})
+
+        return self.observation.copy(), reward, done, done.copy(), infos
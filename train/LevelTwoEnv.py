@@ -1,11 +1,15 @@
 import gymnasium as gym
 from gymnasium import spaces
 
+import math
 import pygame
 import random
 import numpy as np
 
 from Agent import Agent
+from GridRenderer import GridRenderer
+from FreeCellSampler import FreeCellSampler
+from PositionHistory import PositionHistory
 from gymnasium.envs.registration import register
 from typing import Optional, Union
 
@@ -14,14 +18,24 @@ HEIGHT = 25
 WIDTH = 25
 NUM_PREV_STATES = 5
 
+# The head can leave the board by one cell before the episode ends (and sit on
+# x == WIDTH / y == HEIGHT without ending it), so the occupancy grid is padded
+# far enough that the 3x3 vision window never indexes outside of it.
+PAD = 2
+GRID_WIDTH = WIDTH + 2 * PAD + 1
+GRID_HEIGHT = HEIGHT + 2 * PAD + 1
+
+SINGLE_LAYOUT = np.zeros(1, dtype=np.int64)
+
 class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
 
-    def __init__(self, render_mode: Optional[str] = None):
+    def __init__(self, render_mode: Optional[str] = None, preallocated_obs: bool = False):
         super().__init__()
         
         self.metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 30}
 
         self.screen = None
+        self.renderer = None
 
         self.done = False 
         self.run = True
@@ -30,53 +44,89 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         self.action_space = spaces.Discrete(4)
         self.observation_space = spaces.Box(low=0, high=1, shape=(14,), dtype=float)
 
+        # When toggled, every observation is written into one float32 buffer and
+        # step() returns that same array, so callers must copy what they keep.
+        self.preallocated_obs = preallocated_obs
+        if preallocated_obs:
+            self.observation_space = spaces.Box(low=0, high=1, shape=(14,), dtype=np.float32)
+            self.observation = np.zeros(14, dtype=np.float32)
+            self.vision_buffer = self.observation[:9].reshape(3, 3)
+
         self.info = {}
 
-        self.prev_positions = []
+        self.prev_positions = PositionHistory(NUM_PREV_STATES, GRID_WIDTH * GRID_HEIGHT)
 
         self.Agent = Agent()
 
         self.step_counter = 0
 
-        self.hologram_tiles = self.generate_hologram_tiles()
+        self.free_cells = FreeCellSampler(1, WIDTH, HEIGHT)
+        self.generate_hologram_tiles()
         self.Apple = self.get_random_apple()
 
-        self.distance = np.linalg.norm(np.array([self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH]) - np.array([self.Apple[0]/WIDTH, self.Apple[1]/WIDTH]))
+        self.distance = self.get_distance()
+
+
+    @property
+    def hologram_tiles(self):
+        # [x, y] of every hologram tile, derived from the grid for the renderer
+        return np.argwhere(self.hologram_grid[PAD:PAD+WIDTH, PAD:PAD+HEIGHT]).tolist()
+
+    def is_hologram(self, x, y):
+        return 0 <= x < WIDTH and 0 <= y < HEIGHT and self.hologram_grid[x+PAD, y+PAD] == 1
+
+    def get_head_cell(self):
+        return (self.Agent.head[0] + PAD) * GRID_HEIGHT + self.Agent.head[1] + PAD
 
-    
     def get_random_apple(self):
-        while True:
-            pos = [random.randrange(1,int(WIDTH)),random.randrange(1,int(HEIGHT))]
-            if pos not in self.hologram_tiles:
-                return pos
+        # uniform over the free cells of the layout, never under the agent
+        x, y = self.free_cells.sample(SINGLE_LAYOUT, np.array([random.random()]), np.array([self.Agent.head]))
+        return [int(x[0]), int(y[0])]
 
     def generate_hologram_tiles(self):
+        # padded occupancy grid indexed [x+PAD, y+PAD]: 1 = hologram tile or off the board
+        hologram_grid = np.ones((GRID_WIDTH, GRID_HEIGHT), dtype=np.uint8)
+        hologram_grid[PAD:PAD+WIDTH, PAD:PAD+HEIGHT] = 0
         num_hologram_tiles = random.randint(25, 50)
-        hologram_tiles = []
         for _ in range(num_hologram_tiles):
             x = random.randrange(1, WIDTH)
             y = random.randrange(1, HEIGHT)
-            hologram_tiles.append([x, y])
-        return hologram_tiles
+            hologram_grid[x+PAD, y+PAD] = 1
+        self.hologram_grid = hologram_grid
+        self.free_cells.rebuild(SINGLE_LAYOUT, hologram_grid[PAD+1:PAD+WIDTH, PAD+1:PAD+HEIGHT] == 1)
 
     def get_agent_vision(self):
-        vision = np.zeros((3, 3))
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                x = self.Agent.head[0] + i
-                y = self.Agent.head[1] + j
-                if 0 <= x < WIDTH and 0 <= y < HEIGHT:
-                    if [x, y] in self.hologram_tiles:
-                        vision[i+1, j+1] = 1
-                else:
-                    vision[i+1, j+1] = 1
-        return vision.flatten()
+        x = self.Agent.head[0] + PAD
+        y = self.Agent.head[1] + PAD
+        return self.hologram_grid[x-1:x+2, y-1:y+2].flatten()
+
+    def get_distance(self):
+        dx = self.Agent.head[0]/WIDTH - self.Apple[0]/WIDTH
+        dy = self.Agent.head[1]/WIDTH - self.Apple[1]/WIDTH
+        return math.sqrt(dx*dx + dy*dy)
+
+    def get_observation(self):
+        # [vision, [x, y], [target_x, target_y], distance]
+        if not self.preallocated_obs:
+            agent_vision = self.get_agent_vision()
+            return np.concatenate((agent_vision, [self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH, self.Apple[0]/WIDTH, self.Apple[1]/WIDTH, self.distance]))
+
+        x = self.Agent.head[0] + PAD
+        y = self.Agent.head[1] + PAD
+        np.copyto(self.vision_buffer, self.hologram_grid[x-1:x+2, y-1:y+2])
+        observation = self.observation
+        observation[9] = self.Agent.head[0]/WIDTH
+        observation[10] = self.Agent.head[1]/WIDTH
+        observation[11] = self.Apple[0]/WIDTH
+        observation[12] = self.Apple[1]/WIDTH
+        observation[13] = self.distance
+        return observation
 
     def step(self, action):
 
         reward = 0
 
-        self.prev_positions.append(self.Agent.head[:])
+        self.prev_positions.push(self.get_head_cell())
 
         if action == 0: # left
             self.Agent.head[0] -= 1
@@ -90,10 +140,7 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         if action == 3: # Down
             self.Agent.head[1] += 1
 
-        while len(self.prev_positions) > NUM_PREV_STATES:
-            self.prev_positions = self.prev_positions[1:]
-
-        current_distance = np.linalg.norm(np.array([self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH]) - np.array([self.Apple[0]/WIDTH, self.Apple[1]/WIDTH]))
+        current_distance = self.get_distance()
 
         if current_distance < self.distance:
             reward += 1
@@ -101,26 +148,23 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         if current_distance < self.distance:
             reward -= 0.5
         
-        if self.Agent.head in self.prev_positions:
-            # index = self.prev_positions.index(self.Agent.head)
+        if self.get_head_cell() in self.prev_positions:
             reward -= 0.5
 
         self.distance = current_distance
 
-        agent_vision = self.get_agent_vision()
-        # [vision, [x, y], [target_x, target_y], distance]
-        self.observation = np.concatenate((agent_vision, [self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH, self.Apple[0]/WIDTH, self.Apple[1]/WIDTH, self.distance]))
+        self.observation = self.get_observation()
 
-        if self.Agent.head[1] < 0 or self.Agent.head[0] < 0 or self.Agent.head[1] > HEIGHT or self.Agent.head[0] > WIDTH or self.Agent.head in self.hologram_tiles:
+        if self.Agent.head[1] < 0 or self.Agent.head[0] < 0 or self.Agent.head[1] > HEIGHT or self.Agent.head[0] > WIDTH or self.is_hologram(*self.Agent.head):
             reward -= 2.5
             self.done = True
 
-        if self.Apple == self.Agent.head:
+        if self.Agent.is_at(self.Apple):
             reward += 2.5 - 1.5*(self.step_counter / 100)
-            self.prev_positions = []
-            self.Agent.tail.insert(0,list(self.Agent.head))
+            self.prev_positions.clear()
+            self.Agent.grow()
             self.Apple = self.get_random_apple()
-            self.distance = np.linalg.norm(np.array([self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH]) - np.array([self.Apple[0]/WIDTH, self.Apple[1]/WIDTH]))
+            self.distance = self.get_distance()
 
         self.step_counter += 1
 
@@ -134,14 +178,13 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         if seed is not None:
             np.random.seed(seed)
             
-        self.prev_positions = []
+        self.prev_positions.clear()
         self.Agent = Agent()
+        self.generate_hologram_tiles()
         self.Apple = self.get_random_apple()
-        self.distance = np.linalg.norm(np.array([self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH]) - np.array([self.Apple[0]/WIDTH, self.Apple[1]/WIDTH]))
-        agent_vision = self.get_agent_vision()
-        self.observation = np.concatenate((agent_vision, [self.Agent.head[0]/WIDTH, self.Agent.head[1]/WIDTH, self.Apple[0]/WIDTH, self.Apple[1]/WIDTH, self.distance]))
+        self.distance = self.get_distance()
+        self.observation = self.get_observation()
         self.done = False
-        self.hologram_tiles = self.generate_hologram_tiles()
 
         self.step_counter = 0
 
@@ -164,8 +207,7 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
             for pos in self.Agent.tail:
                 pygame.draw.rect(self.screen, (0,0,120), [pos[0], pos[1], 15,15])
 
-            self.Agent.tail.insert(0,list(self.Agent.head))
-            self.Agent.tail.pop()
+            self.Agent.advance_tail()
 
             for pos in self.hologram_tiles:
                 pygame.draw.rect(self.screen, (255,255,0), [pos[0], pos[1], 15,15])
@@ -184,29 +226,18 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
                     self.close()
 
         elif self.render_mode == 'rgb_array':
-            if self.screen is None:
-                self.screen = pygame.Surface((WIDTH*15, HEIGHT*15))
-            
-            self.screen.fill((0, 0, 0))
-            pygame.draw.rect(self.screen, (255, 0, 0), [self.Apple[0]*15, self.Apple[1]*15, 15, 15])
-
-            for pos in self.Agent.tail:
-                pygame.draw.rect(self.screen, (0, 0, 120), [pos[0]*15, pos[1]*15, 15, 15])
+            if self.renderer is None:
+                self.renderer = GridRenderer(WIDTH, HEIGHT)
 
-            self.Agent.tail.insert(0, list(self.Agent.head*15))
-            self.Agent.tail.pop()
+            self.renderer.clear()
+            self.renderer.paint([self.Apple], (255, 0, 0))
+            self.renderer.paint(self.Agent.tail, (0, 0, 120))
 
-            for pos in self.hologram_tiles:
-                pygame.draw.rect(self.screen, (255,255,0), [pos[0]*15, pos[1]*15, 15,15])
+            self.Agent.advance_tail()
 
-            blockSize = 15
-            for x in range(0, 1200, blockSize):
-                for y in range(75, 800, blockSize):
-                    rect = pygame.Rect(x, y, blockSize, blockSize)
-                    pygame.draw.rect(self.screen, (25, 25, 25), rect, 1)
+            self.renderer.paint_mask(self.hologram_grid[PAD:PAD+WIDTH, PAD:PAD+HEIGHT] == 1, (255, 255, 0))
 
-            rgb_array = pygame.surfarray.array3d(self.screen)
-            return rgb_array
+            return self.renderer.render()
     
     def close(self):
         if self.screen is not None:
@@ -219,4 +250,50 @@ class LevelTwoEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
 register(
     id='LevelTwo',
     entry_point='LevelTwoEnv:LevelTwoEnv',
-)
\ No newline at end of file
+)
+
+
+if __name__ == "__main__":
+    # allocation check of preallocated_obs: python LevelTwoEnv.py
+    # It shows that steps retain no NumPy buffers and that a plain step's peak stays within the Python
+    # scalars every step returns. A temporary freed before that peak (like the vision slice's view
+    # header) doesn't raise it, so this bounds the step's footprint rather than counting allocations.
+    import sys
+    import tracemalloc
+
+    random.seed(0)
+    env = LevelTwoEnv(preallocated_obs=True)
+    env.reset()
+    # keep every observation like a rollout would: only a reused buffer keeps this from growing
+    kept = []
+    numpy_buffers = [tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)]
+    # what a step allocates anyway: the returned tuple and a few floats
+    python_objects = sys.getsizeof((None,) * 5) + 4 * sys.getsizeof(0.0)
+    # peak bytes allocated by each step that neither picks up an apple nor ends the episode
+    step_peaks = []
+
+    tracemalloc.start()
+    for step in range(5000):
+        if step == 100:
+            before = len(tracemalloc.take_snapshot().filter_traces(numpy_buffers).traces)
+        if env.done:
+            env.reset()
+        apple, action = env.Apple, random.randrange(4)
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        observation = env.step(action)[0]
+        peak = tracemalloc.get_traced_memory()[1] - current
+        if step >= 100 and not env.done and env.Apple is apple:
+            step_peaks.append(peak)
+        assert observation is env.observation and observation.dtype == np.float32
+        kept.append(observation)
+    after = len(tracemalloc.take_snapshot().filter_traces(numpy_buffers).traces)
+    tracemalloc.stop()
+
+    assert after == before, f"{after - before} NumPy buffers retained over 4900 steps"
+    # the interpreter itself allocates in bursts on a few percent of steps, so the bound is on the 90th percentile
+    step_peaks.sort()
+    typical, high = step_peaks[len(step_peaks) // 2], step_peaks[int(len(step_peaks) * 0.9)]
+    assert high <= python_objects, f"steps peak at {high} bytes (90th percentile), more than the {python_objects} of their Python scalars"
+    print(f"preallocated_obs: {len(kept)} steps, no NumPy buffers retained, "
+          f"{len(step_peaks)} plain steps peak at {typical} bytes (median, {high} at the 90th percentile), within the {python_objects} of their Python scalars")
@@ -0,0 +1,206 @@
+import gymnasium as gym
+from gymnasium import spaces
+
+import numpy as np
+import torch
+
+from SameStepVecEnv import SameStepVecEnv
+from LevelTwoEnv import HEIGHT, WIDTH, NUM_PREV_STATES, PAD, GRID_WIDTH, GRID_HEIGHT
+from LevelTwoVecEnv import MAX_STEPS, MIN_HOLOGRAM_TILES, MAX_HOLOGRAM_TILES, MOVES, VISION_OFFSETS
+from typing import Optional, Union
+
+
+NUM_SPAWN_CELLS = (WIDTH - 1) * (HEIGHT - 1)
+# at most MAX_HOLOGRAM_TILES + 1 of the spawn cells are taken (tiles and the head), so the
+# chance that every draw misses, which would leave the apple on a taken cell, is below
+# (51 / 576) ** 16 ~ 1e-17
+APPLE_CANDIDATES = 16
+
+
+class LevelTwoTorchEnv(SameStepVecEnv):
+    """
+    Batched `LevelTwoEnv` written with torch tensor ops.
+
+    The same state layout as `LevelTwoVecEnv`, but every array is a tensor on
+    `device`, so actions go in and observations, rewards and dones come out
+    without leaving the device the `Agent` runs on. Apples are drawn from
+    `APPLE_CANDIDATES` random cells instead of a `FreeCellSampler` index.
+    Distances are kept in float64 so the reward comparisons match the NumPy
+    envs exactly; the observation itself is float32.
+
+    `step` never waits on the device: apple respawns and resets run on every
+    env and are written through masks, rather than on a nonzero() index list
+    whose size the host would have to read. Finished environments are reset
+    in place during the same `step` call (see `SameStepVecEnv`), and
+    `final_obs` / `final_info` are always present, masked by the dones.
+    `infos["apple"]` and `infos["collision"]` flag the envs that ate an apple
+    or crashed on this step.
+    """
+
+    def __init__(self, num_envs: int = 16, seed: Optional[int] = None, device: Union[str, torch.device] = "cpu"):
+        self.num_envs = num_envs
+        self.closed = False
+        self.render_mode = None
+        self.device = torch.device(device)
+
+        self.single_action_space = spaces.Discrete(4)
+        self.single_observation_space = spaces.Box(low=0, high=1, shape=(14,), dtype=np.float32)
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+
+        self.generator = torch.Generator(device=self.device)
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        else:
+            self.generator.seed()
+
+        long = dict(dtype=torch.long, device=self.device)
+        self.env_indices = torch.arange(num_envs, **long)
+        self.moves = torch.as_tensor(MOVES, **long)
+        self.vision_offsets = torch.as_tensor(VISION_OFFSETS, **long)
+        self.tile_slots = torch.arange(MAX_HOLOGRAM_TILES, **long)
+        self.ring_slots = torch.arange(NUM_PREV_STATES, **long)
+
+        self.heads = torch.zeros((num_envs, 2), **long)
+        self.apples = torch.zeros((num_envs, 2), **long)
+        self.distance = torch.zeros(num_envs, dtype=torch.float64, device=self.device)
+        self.step_counter = torch.zeros(num_envs, **long)
+
+        self.grids = torch.ones((num_envs, GRID_WIDTH, GRID_HEIGHT), dtype=torch.uint8, device=self.device)
+        self.grids[:, PAD:PAD + WIDTH, PAD:PAD + HEIGHT] = 0
+        self.flat_grids = self.grids.view(num_envs, -1)
+        # flat grid index of every hologram tile, the padding corner for unused ones
+        self.tile_cells = torch.zeros((num_envs, MAX_HOLOGRAM_TILES), **long)
+
+        self.prev_positions = torch.zeros((num_envs, NUM_PREV_STATES, 2), **long)
+        self.prev_count = torch.zeros(num_envs, **long)
+        self.prev_cursor = torch.zeros(num_envs, **long)
+
+        self.observation = torch.zeros((num_envs, 14), dtype=torch.float32, device=self.device)
+
+        self.reset_envs(self.env_indices)
+
+    def randint(self, low, high, size):
+        return torch.randint(low, high, size, generator=self.generator, device=self.device)
+
+    def get_distance(self):
+        delta = self.heads.double() / WIDTH - self.apples.double() / WIDTH
+        return (delta * delta).sum(dim=1).sqrt()
+
+    def generate_hologram_tiles(self, mask):
+        num_tiles = self.randint(MIN_HOLOGRAM_TILES, MAX_HOLOGRAM_TILES + 1, (self.num_envs,))
+        tiles = self.randint(1, WIDTH, (self.num_envs, MAX_HOLOGRAM_TILES, 2))
+        used = self.tile_slots < num_tiles[:, None]
+        cells = torch.where(used, (tiles[..., 0] + PAD) * GRID_HEIGHT + tiles[..., 1] + PAD, 0)
+
+        # only the previous tiles are cleared, not the whole board; everything aimed at the
+        # padding corner (unused tiles, the other envs) writes the 1 it always holds
+        old_cells = torch.where(mask[:, None], self.tile_cells, 0)
+        self.flat_grids.scatter_(1, old_cells, (old_cells == 0).byte())
+        self.tile_cells = torch.where(mask[:, None], cells, self.tile_cells)
+        self.flat_grids.scatter_(1, self.tile_cells, 1)
+
+    def get_random_apple(self, mask):
+        # a uniform free spawn cell per env, never under the head: the first free one of
+        # APPLE_CANDIDATES uniform draws, which is far cheaper than a free-cell index rebuilt
+        # (or a random key drawn for every cell) on every step
+        candidates = self.randint(0, NUM_SPAWN_CELLS, (self.num_envs, APPLE_CANDIDATES))
+        x = candidates // (HEIGHT - 1) + 1
+        y = candidates % (HEIGHT - 1) + 1
+        blocked = self.flat_grids.gather(1, (x + PAD) * GRID_HEIGHT + y + PAD) == 1
+        under_head = (x == self.heads[:, :1]) & (y == self.heads[:, 1:])
+        first = (~blocked & ~under_head).byte().argmax(dim=1, keepdim=True)
+
+        apples = torch.cat([x.gather(1, first), y.gather(1, first)], dim=1)
+        self.apples.copy_(torch.where(mask[:, None], apples, self.apples))
+
+    def get_agent_vision(self):
+        centre = (self.heads[:, 0] + PAD) * GRID_HEIGHT + self.heads[:, 1] + PAD
+        return self.flat_grids.gather(1, centre[:, None] + self.vision_offsets)
+
+    def observe(self, mask=None):
+        # [vision, [x, y], [target_x, target_y], distance]
+        observation = torch.cat(
+            [self.get_agent_vision(), self.heads / WIDTH, self.apples / WIDTH, self.distance[:, None]], dim=1
+        ).float()
+        if mask is None:
+            self.observation.copy_(observation)
+        else:
+            self.observation.copy_(torch.where(mask[:, None], observation, self.observation))
+
+    def reset_masked(self, mask):
+        """
+        Reset the envs where the bool `mask` is set. Every env draws and only
+        the masked ones are written, so there are no data-dependent shapes and
+        no host sync.
+        """
+        heads = torch.stack([self.randint(0, WIDTH, (self.num_envs,)), self.randint(0, HEIGHT, (self.num_envs,))], dim=1)
+        self.heads.copy_(torch.where(mask[:, None], heads, self.heads))
+        self.generate_hologram_tiles(mask)
+        self.get_random_apple(mask)
+        self.distance = torch.where(mask, self.get_distance(), self.distance)
+        self.step_counter.masked_fill_(mask, 0)
+        self.prev_count.masked_fill_(mask, 0)
+        self.prev_cursor.masked_fill_(mask, 0)
+        self.observe(mask)
+
+    def reset_envs(self, idx):
+        mask = torch.zeros(self.num_envs, dtype=torch.bool, device=self.device)
+        mask[idx] = True
+        self.reset_masked(mask)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.generator.manual_seed(seed)
+
+        self.reset_envs(self.env_indices)
+
+        return self.observation.clone(), {}
+
+    def autoreset(self, done, infos):
+        # always reported and always reset through the mask: checking for finished envs would sync
+        infos["final_info"] = dict(infos)
+        infos["_final_info"] = done
+        infos["final_obs"] = self.observation.clone()
+        infos["_final_obs"] = done
+        self.reset_masked(done)
+        return infos
+
+    def step(self, actions):
+        actions = torch.as_tensor(actions, dtype=torch.long, device=self.device)
+
+        self.prev_positions[self.env_indices, self.prev_cursor] = self.heads
+        self.prev_cursor = (self.prev_cursor + 1) % NUM_PREV_STATES
+        self.prev_count = torch.clamp(self.prev_count + 1, max=NUM_PREV_STATES)
+
+        self.heads += self.moves[actions]
+        x, y = self.heads[:, 0], self.heads[:, 1]
+
+        current_distance = self.get_distance()
+        reward = torch.where(current_distance < self.distance, 0.5, 0.0).double()
+
+        recent = self.ring_slots < self.prev_count[:, None]
+        revisited = ((self.prev_positions == self.heads[:, None]).all(dim=2) & recent).any(dim=1)
+        reward -= 0.5 * revisited
+
+        self.distance = current_distance
+        self.observe()
+
+        off_board = (x < 0) | (y < 0) | (x > WIDTH) | (y > HEIGHT)
+        on_tile = (x < WIDTH) & (y < HEIGHT) & (self.grids[self.env_indices, x + PAD, y + PAD] == 1)
+        collided = off_board | on_tile
+        reward -= 2.5 * collided
+
+        ate_mask = (self.apples == self.heads).all(dim=1)
+        reward += torch.where(ate_mask, 2.5 - 1.5 * (self.step_counter.double() / MAX_STEPS), 0.0)
+        self.prev_count.masked_fill_(ate_mask, 0)
+        self.prev_cursor.masked_fill_(ate_mask, 0)
+        self.get_random_apple(ate_mask)
+        self.distance = torch.where(ate_mask, self.get_distance(), self.distance)
+
+        self.step_counter += 1
+        done = collided | (self.step_counter >= MAX_STEPS)
+
+        infos = self.autoreset(done, {"apple": ate_mask, "collision": collided})
+
+        return self.observation.clone(), reward.float(), done, done.clone(), infos
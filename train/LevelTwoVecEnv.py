@@ -0,0 +1,161 @@
+import gymnasium as gym
+from gymnasium import spaces
+
+import numpy as np
+
+from SameStepVecEnv import SameStepVecEnv
+from LevelTwoEnv import HEIGHT, WIDTH, NUM_PREV_STATES, PAD, GRID_WIDTH, GRID_HEIGHT
+from FreeCellSampler import FreeCellSampler
+from typing import Optional
+
+
+MAX_STEPS = 100
+MIN_HOLOGRAM_TILES = 25
+MAX_HOLOGRAM_TILES = 50
+
+# left, up, right, down
+MOVES = np.array([[-1, 0], [0, -1], [1, 0], [0, 1]], dtype=np.int64)
+
+# flat grid offsets of the 3x3 window, x-major like LevelTwoEnv.get_agent_vision
+VISION_OFFSETS = np.array(
+    [dx * GRID_HEIGHT + dy for dx in range(-1, 2) for dy in range(-1, 2)], dtype=np.int64
+)
+
+
+class LevelTwoVecEnv(SameStepVecEnv):
+    """
+    Array-based batch engine for `LevelTwoEnv`.
+
+    The state of all `num_envs` environments lives in `(num_envs, ...)` arrays:
+    heads, apples, padded hologram occupancy grids (1 = hologram tile or off
+    the board), step counters and a ring of the last `NUM_PREV_STATES` head
+    positions. `step(actions)` advances every environment at once and returns
+    the same observations and rewards as `LevelTwoEnv.step`.
+
+    Finished environments are reset in place during the same `step` call (see
+    `SameStepVecEnv`). `infos["apple"]` and `infos["collision"]` flag the
+    envs that ate an apple or crashed on this step.
+    """
+
+    def __init__(self, num_envs: int = 16, seed: Optional[int] = None):
+        self.num_envs = num_envs
+        self.closed = False
+        self.render_mode = None
+
+        self.single_action_space = spaces.Discrete(4)
+        self.single_observation_space = spaces.Box(low=0, high=1, shape=(14,), dtype=np.float32)
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+
+        self.np_random = np.random.default_rng(seed)
+        self.env_indices = np.arange(num_envs)
+
+        self.heads = np.zeros((num_envs, 2), dtype=np.int64)
+        self.apples = np.zeros((num_envs, 2), dtype=np.int64)
+        self.distance = np.zeros(num_envs, dtype=np.float64)
+        self.step_counter = np.zeros(num_envs, dtype=np.int64)
+
+        self.grids = np.ones((num_envs, GRID_WIDTH, GRID_HEIGHT), dtype=np.uint8)
+        self.flat_grids = self.grids.reshape(num_envs, -1)
+        self.free_cells = FreeCellSampler(num_envs, WIDTH, HEIGHT)
+
+        self.prev_positions = np.zeros((num_envs, NUM_PREV_STATES, 2), dtype=np.int64)
+        self.prev_count = np.zeros(num_envs, dtype=np.int64)
+        self.prev_cursor = np.zeros(num_envs, dtype=np.int64)
+
+        self.observation = np.zeros((num_envs, 14), dtype=np.float32)
+
+        self.reset_envs(self.env_indices)
+
+    def get_distance(self, idx):
+        delta = self.heads[idx] / WIDTH - self.apples[idx] / WIDTH
+        return np.sqrt((delta * delta).sum(axis=1))
+
+    def generate_hologram_tiles(self, idx):
+        count = len(idx)
+        self.grids[idx, PAD:PAD + WIDTH, PAD:PAD + HEIGHT] = 0
+
+        num_tiles = self.np_random.integers(MIN_HOLOGRAM_TILES, MAX_HOLOGRAM_TILES + 1, count)
+        tiles = self.np_random.integers(1, WIDTH, (count, MAX_HOLOGRAM_TILES, 2))
+        used = np.arange(MAX_HOLOGRAM_TILES) < num_tiles[:, None]
+
+        rows = np.broadcast_to(idx[:, None], used.shape)[used]
+        self.grids[rows, tiles[..., 0][used] + PAD, tiles[..., 1][used] + PAD] = 1
+
+        self.free_cells.rebuild(idx, self.grids[idx, PAD + 1:PAD + WIDTH, PAD + 1:PAD + HEIGHT] == 1)
+
+    def get_random_apple(self, idx):
+        uniforms = self.np_random.random(len(idx))
+        self.apples[idx, 0], self.apples[idx, 1] = self.free_cells.sample(idx, uniforms, self.heads[idx])
+
+    def get_agent_vision(self, idx):
+        centre = (self.heads[idx, 0] + PAD) * GRID_HEIGHT + self.heads[idx, 1] + PAD
+        return self.flat_grids[idx[:, None], centre[:, None] + VISION_OFFSETS]
+
+    def observe(self, idx):
+        # [vision, [x, y], [target_x, target_y], distance]
+        self.observation[idx, :9] = self.get_agent_vision(idx)
+        self.observation[idx, 9:11] = self.heads[idx] / WIDTH
+        self.observation[idx, 11:13] = self.apples[idx] / WIDTH
+        self.observation[idx, 13] = self.distance[idx]
+
+    def reset_envs(self, idx):
+        self.heads[idx, 0] = self.np_random.integers(0, WIDTH, len(idx))
+        self.heads[idx, 1] = self.np_random.integers(0, HEIGHT, len(idx))
+        self.generate_hologram_tiles(idx)
+        self.get_random_apple(idx)
+        self.distance[idx] = self.get_distance(idx)
+        self.step_counter[idx] = 0
+        self.prev_count[idx] = 0
+        self.prev_cursor[idx] = 0
+        self.observe(idx)
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self.np_random = np.random.default_rng(seed)
+
+        self.reset_envs(self.env_indices)
+
+        return self.observation.copy(), {}
+
+    def step(self, actions):
+        idx = self.env_indices
+        actions = np.asarray(actions, dtype=np.int64)
+
+        self.prev_positions[idx, self.prev_cursor] = self.heads
+        self.prev_cursor = (self.prev_cursor + 1) % NUM_PREV_STATES
+        self.prev_count = np.minimum(self.prev_count + 1, NUM_PREV_STATES)
+
+        self.heads += MOVES[actions]
+        x, y = self.heads[:, 0], self.heads[:, 1]
+
+        current_distance = self.get_distance(idx)
+        reward = np.where(current_distance < self.distance, 0.5, 0.0)
+
+        recent = np.arange(NUM_PREV_STATES) < self.prev_count[:, None]
+        revisited = ((self.prev_positions == self.heads[:, None]).all(axis=2) & recent).any(axis=1)
+        reward -= 0.5 * revisited
+
+        self.distance = current_distance
+        self.observe(idx)
+
+        off_board = (x < 0) | (y < 0) | (x > WIDTH) | (y > HEIGHT)
+        on_tile = (x < WIDTH) & (y < HEIGHT) & (self.grids[idx, x + PAD, y + PAD] == 1)
+        collided = off_board | on_tile
+        reward -= 2.5 * collided
+
+        ate_mask = (self.apples == self.heads).all(axis=1)
+        ate = np.flatnonzero(ate_mask)
+        if len(ate):
+            reward[ate] += 2.5 - 1.5 * (self.step_counter[ate] / MAX_STEPS)
+            self.prev_count[ate] = 0
+            self.prev_cursor[ate] = 0
+            self.get_random_apple(ate)
+            self.distance[ate] = self.get_distance(ate)
+
+        self.step_counter += 1
+        done = collided | (self.step_counter >= MAX_STEPS)
+
+        infos = self.autoreset(done, {"apple": ate_mask, "collision": collided})
+
+        return self.observation.copy(), reward, done, done.copy(), infos
@@ -0,0 +1,32 @@
+import numpy as np
+import torch
+
+
+class MetricsAccumulator:
+    """
+    Running sums of training metrics, kept on the device they are computed on.
+
+    `add` only queues tensor ops, so the update loop never waits on the
+    device; `flush` copies every sum to the host in a single transfer and
+    returns the mean of each metric since the previous flush.
+    """
+
+    def __init__(self, names, device):
+        self.names = list(names)
+        self.sums = torch.zeros(len(self.names), device=device)
+        self.counts = np.zeros(len(self.names), dtype=np.int64)
+
+    def add(self, name, values):
+        """Add a scalar for `name`, or a 1-D tensor for `name` and the metrics listed after it."""
+        start = self.names.index(name)
+        values = torch.as_tensor(values, dtype=self.sums.dtype, device=self.sums.device).reshape(-1)
+        end = start + len(values)
+        self.sums[start:end] += values
+        self.counts[start:end] += 1
+
+    def flush(self):
+        sums = self.sums.tolist()
+        self.sums.zero_()
+        means = {name: total / count for name, total, count in zip(self.names, sums, self.counts) if count}
+        self.counts[:] = 0
+        return means
@@ -0,0 +1,46 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PipelinedCollector:
+    """
+    Double-buffered actor/learner overlap around a `RolloutCollector`.
+
+    A background thread fills one `RolloutBuffer` with a snapshot of the
+    policy while the learner trains on the other. `next` returns the rollout
+    that just finished together with the policy version that collected it
+    and immediately starts the next one with the current weights, so the
+    training batch is never more than one iteration behind the learner.
+    """
+
+    def __init__(self, collector, agent, storages):
+        self.collector = collector
+        self.storages = storages
+        self.turn = 0
+        self.snapshot = copy.deepcopy(agent).requires_grad_(False)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollout")
+        self.pending = None
+
+    def start(self, agent, version):
+        # only called once the previous rollout is done with the snapshot
+        self.snapshot.load_state_dict(agent.state_dict())
+        storage = self.storages[self.turn]
+        self.turn = 1 - self.turn
+        future = self.executor.submit(self.collector.collect, self.snapshot, storage)
+        self.pending = (future, storage, version)
+
+    def next(self, agent, version):
+        """Wait for the in-flight rollout, start the next one, return `(storage, policy_version)`."""
+        if self.pending is None:
+            self.start(agent, version)
+
+        future, storage, policy_version = self.pending
+        future.result()
+        self.start(agent, version)
+        return storage, policy_version
+
+    def close(self):
+        if self.pending is not None:
+            self.pending[0].result()
+            self.pending = None
+        self.executor.shutdown()
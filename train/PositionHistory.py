@@ -0,0 +1,41 @@
+from array import array
+
+
+class PositionHistory:
+    """
+    Fixed-capacity ring of the last `capacity` cell ids.
+
+    `counts` tracks how many ring slots hold each cell id, so `push` and the
+    `in` test are O(1) and the memory used never grows with episode length.
+    """
+
+    __slots__ = ("capacity", "ring", "counts", "cursor", "size")
+
+    def __init__(self, capacity, num_cells):
+        self.capacity = capacity
+        self.ring = array('i', [0]) * capacity
+        self.counts = array('i', [0]) * num_cells
+        self.cursor = 0
+        self.size = 0
+
+    def push(self, cell):
+        if self.size == self.capacity:
+            self.counts[self.ring[self.cursor]] -= 1
+        else:
+            self.size += 1
+        self.ring[self.cursor] = cell
+        self.counts[cell] += 1
+        self.cursor = (self.cursor + 1) % self.capacity
+
+    def clear(self):
+        # until the ring wraps its entries sit in slots [0, size)
+        for slot in range(self.size):
+            self.counts[self.ring[slot]] -= 1
+        self.cursor = 0
+        self.size = 0
+
+    def __contains__(self, cell):
+        return self.counts[cell] > 0
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,177 @@
+from collections import namedtuple
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+import tyro
+
+from gae import compute_gae, gae_workspace
+from ppo_update import compile_with_fallback
+
+
+Minibatch = namedtuple("Minibatch", ["obs", "actions", "logprobs", "advantages", "returns", "values"])
+
+# fields gathered into the per-epoch shuffled copy that minibatches are sliced from
+MINIBATCH_FIELDS = Minibatch._fields
+
+# fields stored in the observation dtype, in a block of their own unless that is float32
+OBS_FIELDS = ("obs", "next_obs")
+
+
+def field_shapes(num_steps, num_envs, obs_shape, action_shape):
+    return {
+        "obs": (num_steps, num_envs) + tuple(obs_shape),
+        "actions": (num_steps, num_envs) + tuple(action_shape),
+        "logprobs": (num_steps, num_envs),
+        "rewards": (num_steps, num_envs),
+        "dones": (num_steps, num_envs),
+        "values": (num_steps, num_envs),
+        "advantages": (num_steps, num_envs),
+        "returns": (num_steps, num_envs),
+        "next_obs": (num_envs,) + tuple(obs_shape),
+        "next_done": (num_envs,),
+    }
+
+
+def shuffled_shapes(shapes):
+    batch_size = shapes["rewards"][0] * shapes["rewards"][1]
+    return {name: (batch_size,) + shapes[name][2:] for name in MINIBATCH_FIELDS}
+
+
+def split_obs_fields(shapes, obs_dtype):
+    """`(float32 fields, observation fields)`: all fields stay float32 for float32 observations."""
+    if obs_dtype == torch.float32:
+        return shapes, {}
+    return (
+        {name: shape for name, shape in shapes.items() if name not in OBS_FIELDS},
+        {name: shape for name, shape in shapes.items() if name in OBS_FIELDS},
+    )
+
+
+def block_size(shapes):
+    return sum(int(np.prod(shape)) for shape in shapes.values())
+
+
+def carve(block, shapes):
+    """Split a flat tensor into views with the given shapes, in order."""
+    views, offset = {}, 0
+    for name, shape in shapes.items():
+        size = int(np.prod(shape))
+        views[name] = block[offset:offset + size].view(shape)
+        offset += size
+    return views
+
+
+class RolloutBuffer:
+    """
+    Preallocated rollout storage, each field a view into a contiguous block.
+
+    The collector writes every step in place (`obs`, `actions`, `logprobs`,
+    `rewards`, `dones`, `values` are `[num_steps, num_envs, ...]`), then
+    `compute_advantages` fills `advantages` and `returns` in place.
+    `minibatches` gathers the training fields once per epoch into a second
+    block in shuffled order, so each minibatch is a contiguous slice instead
+    of a fancy-index gather. The blocks can be pinned (for fast host to GPU
+    copies) or moved to shared memory (for collector processes). Observations
+    that aren't float32 (uint8 images) keep their dtype in blocks of their
+    own and are turned into float one minibatch at a time. The GAE scan runs
+    in its own preallocated workspace, through `torch.compile` with
+    `compile_gae`.
+    """
+
+    def __init__(self, num_steps, num_envs, obs_shape, action_shape, device, pin_memory=False, share_memory=False, compile_gae=False, obs_dtype=torch.float32):
+        self.num_steps = num_steps
+        self.num_envs = num_envs
+        self.batch_size = num_steps * num_envs
+        self.shapes = field_shapes(num_steps, num_envs, obs_shape, action_shape)
+        self.flat_shapes = shuffled_shapes(self.shapes)
+        self.obs_dtype = obs_dtype
+
+        float_shapes, obs_shapes = split_obs_fields(self.shapes, obs_dtype)
+        flat_float_shapes, flat_obs_shapes = split_obs_fields(self.flat_shapes, obs_dtype)
+        self.storage = self.allocate(block_size(float_shapes), device, pin_memory, share_memory)
+        views = carve(self.storage, float_shapes)
+        self.shuffled_storage = self.allocate(block_size(flat_float_shapes), device, pin_memory, share_memory)
+        self.shuffled = carve(self.shuffled_storage, flat_float_shapes)
+        if obs_shapes:
+            self.obs_storage = self.allocate(block_size(obs_shapes), device, pin_memory, share_memory, obs_dtype)
+            views.update(carve(self.obs_storage, obs_shapes))
+            self.shuffled_obs_storage = self.allocate(block_size(flat_obs_shapes), device, pin_memory, share_memory, obs_dtype)
+            self.shuffled.update(carve(self.shuffled_obs_storage, flat_obs_shapes))
+        for name, view in views.items():
+            setattr(self, name, view)
+
+        self.gae_workspace = gae_workspace(self.rewards)
+        self.gae = compile_with_fallback(compute_gae) if compile_gae else compute_gae
+
+    @staticmethod
+    def allocate(size, device, pin_memory, share_memory, dtype=torch.float32):
+        # pinning only applies to host memory and needs a CUDA runtime
+        pin_memory = pin_memory and torch.device(device).type == "cpu" and torch.cuda.is_available()
+        storage = torch.zeros(size, dtype=dtype, device=device, pin_memory=pin_memory)
+        if share_memory:
+            storage.share_memory_()
+        return storage
+
+    @classmethod
+    def from_envs(cls, num_steps, envs, device, **kwargs):
+        space = envs.single_observation_space
+        obs_dtype = torch.uint8 if space.dtype == np.uint8 else torch.float32
+        return cls(num_steps, envs.num_envs, space.shape, envs.single_action_space.shape, device, obs_dtype=obs_dtype, **kwargs)
+
+    def compute_advantages(self, next_value, gamma, gae_lambda):
+        self.gae(
+            self.rewards, self.values, self.dones, next_value, self.next_done, gamma, gae_lambda,
+            advantages=self.advantages, returns=self.returns, workspace=self.gae_workspace,
+        )
+
+    def minibatches(self, minibatch_size, generator=None):
+        permutation = torch.randperm(self.batch_size, generator=generator).to(self.storage.device)
+        for name in MINIBATCH_FIELDS:
+            flat = getattr(self, name).reshape(self.flat_shapes[name])
+            torch.index_select(flat, 0, permutation, out=self.shuffled[name])
+
+        for start in range(0, self.batch_size, minibatch_size):
+            end = start + minibatch_size
+            # a no-op for float32 observations
+            obs = self.shuffled["obs"][start:end].float()
+            yield Minibatch(obs, *(self.shuffled[name][start:end] for name in MINIBATCH_FIELDS[1:]))
+
+    def memory_report(self):
+        return memory_report(self.shapes, self.flat_shapes, self.obs_dtype.itemsize)
+
+
+def memory_report(shapes, flat_shapes, obs_itemsize=4):
+    lines = [f"{'field':<12}{'shape':<28}{'MiB':>10}"]
+    total = 0
+    for name, shape in list(shapes.items()) + [(f"{name}*", shape) for name, shape in flat_shapes.items()]:
+        size = int(np.prod(shape)) * (obs_itemsize if name.rstrip("*") in OBS_FIELDS else 4)
+        total += size
+        lines.append(f"{name:<12}{str(tuple(shape)):<28}{size / 2**20:>10.2f}")
+    workspace = (4, 2 * shapes["rewards"][0], shapes["rewards"][1])
+    size = int(np.prod(workspace)) * 4
+    total += size
+    lines.append(f"{'gae**':<12}{str(workspace):<28}{size / 2**20:>10.2f}")
+    lines.append(f"{'total':<40}{total / 2**20:>10.2f}")
+    lines.append("* per-epoch shuffled copy used for minibatches")
+    lines.append("** scan workspace of compute_gae")
+    return "\n".join(lines)
+
+
+@dataclass
+class MemoryArgs:
+    num_envs: int = 16
+    """the number of parallel game environments"""
+    num_steps: int = 128
+    """the number of steps to run in each environment per policy rollout"""
+    obs_size: int = 14
+    """the flat observation size (14 for LevelTwo, 5 for LevelOne, 148 for DynamicObstacles)"""
+    uint8_obs: bool = False
+    """if toggled, size uint8 observations (DynamicObstacles) instead of float32 ones"""
+
+
+if __name__ == "__main__":
+    # size a buffer without allocating it: python RolloutBuffer.py --num-envs 4096 --num-steps 256
+    args = tyro.cli(MemoryArgs)
+    shapes = field_shapes(args.num_steps, args.num_envs, (args.obs_size,), ())
+    print(memory_report(shapes, shuffled_shapes(shapes), 1 if args.uint8_obs else 4))
@@ -0,0 +1,74 @@
+import numpy as np
+import torch
+
+from LevelTwoTorchEnv import LevelTwoTorchEnv
+from SharedMemoryVecEnv import SharedMemoryVecEnv
+
+
+class RolloutCollector:
+    """
+    Steps `envs` with a policy and writes the transitions into a `RolloutBuffer`.
+
+    Keeps the env's current observation and done flags between calls, and
+    picks the cheapest conversion path for the kind of vector env it drives:
+    torch envs stay on device, shared-memory envs are read through
+    `torch.from_numpy` views, everything else goes through NumPy.
+    Observations keep their own dtype on the way to the device and in the
+    `RolloutBuffer` (uint8 images stay a quarter of the size); only the
+    policy's forward pass sees them as float.
+    """
+
+    def __init__(self, envs, num_envs, device):
+        self.envs = envs
+        self.device = device
+        self.on_device = isinstance(envs, LevelTwoTorchEnv)
+        self.shared = isinstance(envs, SharedMemoryVecEnv)
+        if self.shared:
+            # zero-copy tensor views of the worker pool's shared buffers
+            self.shared_obs = torch.from_numpy(envs.observations)
+            self.shared_rewards = torch.from_numpy(envs.rewards)
+            self.shared_terminations = torch.from_numpy(envs.terminations)
+            self.shared_truncations = torch.from_numpy(envs.truncations)
+
+        self.next_obs = None
+        self.next_done = torch.zeros(num_envs).to(device)
+
+    def reset(self, seed=None):
+        next_obs, _ = self.envs.reset(seed=seed)
+        self.next_obs = self.to_device(next_obs)
+        self.next_done.zero_()
+
+    def to_device(self, obs):
+        return torch.as_tensor(obs).to(self.device)
+
+    def step_envs(self, action):
+        if self.on_device:
+            next_obs, reward, terminations, truncations, infos = self.envs.step(action)
+            return next_obs, reward, torch.logical_or(terminations, truncations).float()
+
+        if self.shared:
+            self.envs.step(action.cpu().numpy())
+            next_done = torch.logical_or(self.shared_terminations, self.shared_truncations).float()
+            return self.shared_obs.to(self.device), self.shared_rewards, next_done.to(self.device)
+
+        next_obs, reward, terminations, truncations, infos = self.envs.step(action.cpu().numpy())
+        next_done = np.logical_or(terminations, truncations)
+        reward = torch.tensor(reward).to(self.device).view(-1)
+        return self.to_device(next_obs), reward, torch.Tensor(next_done).to(self.device)
+
+    def collect(self, agent, storage):
+        for step in range(storage.obs.shape[0]):
+            storage.obs[step] = self.next_obs
+            storage.dones[step] = self.next_done
+
+            # ALGO LOGIC: action logic
+            action, logprob, value = agent.act(self.next_obs.float())
+            storage.values[step] = value
+            storage.actions[step] = action
+            storage.logprobs[step] = logprob
+
+            self.next_obs, storage.rewards[step], self.next_done = self.step_envs(action)
+
+        storage.next_obs.copy_(self.next_obs)
+        storage.next_done.copy_(self.next_done)
+        return storage
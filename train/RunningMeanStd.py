@@ -0,0 +1,80 @@
+import torch
+import torch.nn as nn
+
+
+class RunningMeanStd(nn.Module):
+    """
+    Running mean and variance of a stream of batches, applied as a layer.
+
+    `update` folds a whole batch in at once (Chan et al.'s parallel
+    algorithm), `forward` returns `(x - mean) / std` clipped to `[-clip, clip]`.
+    The statistics are float64 buffers, so they are saved with the model's
+    state dict and exported with it to ONNX.
+    """
+
+    def __init__(self, shape=(), epsilon=1e-8, clip=10.0):
+        super().__init__()
+        self.epsilon = epsilon
+        self.clip = clip
+        self.register_buffer("mean", torch.zeros(shape, dtype=torch.float64))
+        self.register_buffer("var", torch.ones(shape, dtype=torch.float64))
+        self.register_buffer("count", torch.tensor(1e-4, dtype=torch.float64))
+
+    @torch.no_grad()
+    def update(self, x):
+        """Fold in a `(batch, *shape)` tensor."""
+        x = x.double()
+        batch_mean = x.mean(dim=0)
+        batch_var = x.var(dim=0, correction=0)
+        batch_count = x.shape[0]
+
+        delta = batch_mean - self.mean
+        total = self.count + batch_count
+        self.mean += delta * batch_count / total
+        self.var.copy_((self.var * self.count + batch_var * batch_count + delta ** 2 * self.count * batch_count / total) / total)
+        self.count.copy_(total)
+
+    def forward(self, x):
+        std = (self.var + self.epsilon).sqrt()
+        return torch.clamp((x - self.mean.to(x.dtype)) / std.to(x.dtype), -self.clip, self.clip)
+
+
+class ReturnNormalizer(nn.Module):
+    """
+    Scales rewards by the running std of the discounted return.
+
+    Keeps the discounted return of every env across rollouts (not saved, it
+    only describes episodes in flight) and updates the statistics once per
+    rollout. Rewards are divided, not centred, so their sign is kept.
+    """
+
+    def __init__(self, epsilon=1e-8, clip=10.0):
+        super().__init__()
+        self.return_rms = RunningMeanStd(epsilon=epsilon, clip=clip)
+        self.register_buffer("returns", torch.zeros(0), persistent=False)
+
+    @torch.no_grad()
+    def forward(self, rewards, dones, next_done, gamma: float):
+        """
+        Normalize `(num_steps, num_envs)` rewards in place.
+
+        `dones[t]` flags that step `t` starts a new episode, like in
+        `RolloutBuffer`, so the episode that produced `rewards[t]` ended if
+        `dones[t + 1]` (or `next_done` for the last step) is set.
+        """
+        if self.returns.shape != rewards.shape[1:]:
+            self.returns = torch.zeros_like(rewards[0])
+
+        ended = torch.cat((dones[1:], next_done[None]))
+        discounted = torch.empty_like(rewards)
+        returns = self.returns
+        for t in range(rewards.shape[0]):
+            returns = returns * gamma + rewards[t]
+            discounted[t] = returns
+            returns = returns * (1.0 - ended[t])
+        self.returns = returns
+
+        self.return_rms.update(discounted.reshape(-1))
+        std = (self.return_rms.var + self.return_rms.epsilon).sqrt().to(rewards.dtype)
+        rewards.copy_(torch.clamp(rewards / std, -self.return_rms.clip, self.return_rms.clip))
+        return rewards
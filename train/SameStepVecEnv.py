@@ -0,0 +1,33 @@
+import gymnasium as gym
+from gymnasium.vector import AutoresetMode
+
+import numpy as np
+
+
+class SameStepVecEnv(gym.vector.VectorEnv):
+    """
+    Base of the batch engines that reset finished environments in place.
+
+    Subclasses keep the current observations in an `observation` buffer and
+    reset a set of env indices with `reset_envs(idx)`. `autoreset(done,
+    infos)` resets the `done` envs during the same `step` call, following
+    gymnasium's `AutoresetMode.SAME_STEP`: the observation they ended on is
+    returned in `infos["final_obs"]` and the step's infos in
+    `infos["final_info"]`, both masked by `done`, so gymnasium's vector
+    wrappers work on top of the engines.
+    """
+
+    metadata = {"render_modes": [], "autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def autoreset(self, done, infos):
+        finished = np.flatnonzero(done)
+        if len(finished):
+            infos["final_info"] = dict(infos)
+            infos["_final_info"] = done
+            infos["final_obs"] = self.observation.copy()
+            infos["_final_obs"] = done
+            self.reset_envs(finished)
+        return infos
+
+    def close(self, **kwargs):
+        self.closed = True
@@ -0,0 +1,196 @@
+import ctypes
+import multiprocessing as mp
+import os
+import random
+import traceback
+
+import gymnasium as gym
+from gymnasium import spaces
+from gymnasium.vector import AutoresetMode
+
+import numpy as np
+from typing import Callable, Optional, Sequence
+
+
+def create_shared_array(ctx, shape, dtype):
+    dtype = np.dtype(dtype)
+    raw = ctx.RawArray(ctypes.c_byte, int(np.prod(shape)) * dtype.itemsize)
+    return raw, shape, dtype
+
+
+def as_array(shared):
+    raw, shape, dtype = shared
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def shared_memory_worker(remote, parent_remote, env_fns, offset, buffers):
+    parent_remote.close()
+    # forked workers inherit the parent's global RNG state, and the level envs
+    # draw from the global `random` module, so give every worker its own stream
+    random.seed()
+    np.random.seed()
+    envs = [env_fn() for env_fn in env_fns]
+    window = slice(offset, offset + len(envs))
+
+    observations = as_array(buffers["observations"])[window]
+    final_observations = as_array(buffers["final_observations"])[window]
+    rewards = as_array(buffers["rewards"])[window]
+    terminations = as_array(buffers["terminations"])[window]
+    truncations = as_array(buffers["truncations"])[window]
+    actions = as_array(buffers["actions"])[window]
+
+    try:
+        while True:
+            command, data = remote.recv()
+            result = None
+
+            if command == "reset":
+                if data is not None:
+                    random.seed(data + offset)
+                    np.random.seed(data + offset)
+                for i, env in enumerate(envs):
+                    seed = None if data is None else data + offset + i
+                    observations[i], _ = env.reset(seed=seed)
+                rewards[:] = 0
+                terminations[:] = False
+                truncations[:] = False
+
+            elif command == "step":
+                # (env index, info) of the finished episodes, the only infos sent back
+                result = []
+                for i, env in enumerate(envs):
+                    observation, reward, terminated, truncated, info = env.step(actions[i])
+                    if terminated or truncated:
+                        final_observations[i] = observation
+                        result.append((offset + i, info))
+                        observation, _ = env.reset()
+                    observations[i] = observation
+                    rewards[i] = reward
+                    terminations[i] = terminated
+                    truncations[i] = truncated
+
+            elif command == "close":
+                break
+
+            remote.send((True, result))
+    except Exception:
+        remote.send((False, traceback.format_exc()))
+    finally:
+        for env in envs:
+            env.close()
+        remote.close()
+
+
+class SharedMemoryVecEnv(gym.vector.VectorEnv):
+    """
+    Worker-pool vector env where each process steps a slice of environments.
+
+    Actions, observations, rewards and termination flags live in shared
+    memory. The parent writes the actions, sends every worker a one-word
+    command and waits for an acknowledgement, which only carries the infos of
+    finished episodes, so no observation data is pickled per step. `step` and `reset` return NumPy views of the shared
+    buffers; they are overwritten by the next call, so copy anything you keep
+    (or wrap them once with `torch.from_numpy`).
+
+    Only `Box` observation spaces are supported. Float observations are
+    stored as float32 so the buffers can go straight into the policy.
+    Finished environments are reset in the same `step` call, like in
+    `SameStepVecEnv`: the observation they ended on is returned in
+    `infos["final_obs"]` (another shared buffer) and their last info in
+    `infos["final_info"]`. Only these infos are sent back by the workers;
+    the other envs' step infos are not collected.
+    """
+
+    metadata = {"render_modes": [], "autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, env_fns: Sequence[Callable[[], gym.Env]], num_workers: Optional[int] = None, context: str = "fork"):
+        self.num_envs = len(env_fns)
+        self.closed = False
+        self.render_mode = None
+
+        dummy_env = env_fns[0]()
+        self.single_action_space = dummy_env.action_space
+        observation_space = dummy_env.observation_space
+        dummy_env.close()
+
+        if not isinstance(observation_space, spaces.Box):
+            raise ValueError(f"SharedMemoryVecEnv only supports Box observations, got {observation_space}")
+
+        obs_dtype = np.float32 if np.issubdtype(observation_space.dtype, np.floating) else observation_space.dtype
+        self.single_observation_space = spaces.Box(
+            low=observation_space.low.astype(obs_dtype),
+            high=observation_space.high.astype(obs_dtype),
+            shape=observation_space.shape,
+            dtype=obs_dtype,
+        )
+        self.action_space = gym.vector.utils.batch_space(self.single_action_space, self.num_envs)
+        self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, self.num_envs)
+
+        ctx = mp.get_context(context)
+        buffers = {
+            "observations": create_shared_array(ctx, (self.num_envs,) + observation_space.shape, obs_dtype),
+            "final_observations": create_shared_array(ctx, (self.num_envs,) + observation_space.shape, obs_dtype),
+            "rewards": create_shared_array(ctx, (self.num_envs,), np.float32),
+            "terminations": create_shared_array(ctx, (self.num_envs,), np.bool_),
+            "truncations": create_shared_array(ctx, (self.num_envs,), np.bool_),
+            "actions": create_shared_array(ctx, (self.num_envs,) + self.single_action_space.shape, self.single_action_space.dtype),
+        }
+        self.observations = as_array(buffers["observations"])
+        self.final_observations = as_array(buffers["final_observations"])
+        self.rewards = as_array(buffers["rewards"])
+        self.terminations = as_array(buffers["terminations"])
+        self.truncations = as_array(buffers["truncations"])
+        self.actions = as_array(buffers["actions"])
+
+        num_workers = min(num_workers or os.cpu_count() or 1, self.num_envs)
+        self.remotes = []
+        self.processes = []
+        for env_slice in np.array_split(np.arange(self.num_envs), num_workers):
+            remote, worker_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=shared_memory_worker,
+                args=(worker_remote, remote, [env_fns[i] for i in env_slice], int(env_slice[0]), buffers),
+                daemon=True,
+            )
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def broadcast(self, command, data=None):
+        for remote in self.remotes:
+            remote.send((command, data))
+        replies = [remote.recv() for remote in self.remotes]
+        errors = [result for ok, result in replies if not ok]
+        if errors:
+            raise RuntimeError("SharedMemoryVecEnv worker failed:\n" + errors[0])
+        return [result for _, result in replies]
+
+    def reset(self, seed=None, options=None):
+        self.broadcast("reset", seed)
+        return self.observations, {}
+
+    def step(self, actions):
+        self.actions[:] = actions
+        finished = [item for result in self.broadcast("step") for item in result]
+
+        infos = {}
+        if finished:
+            done = np.logical_or(self.terminations, self.truncations)
+            final_info = {}
+            for i, info in finished:
+                final_info = self._add_info(final_info, info, i)
+            infos = {"final_obs": self.final_observations, "_final_obs": done, "final_info": final_info, "_final_info": done}
+        return self.observations, self.rewards, self.terminations, self.truncations, infos
+
+    def close(self, **kwargs):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            try:
+                remote.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.closed = True
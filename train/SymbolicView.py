@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class SymbolicView:
+    """
+    Compact float32 observations of `DynamicObstaclesEngine` state, an
+    alternative to `EgocentricView` for MLP policies.
+
+    Each observation holds:
+    - the agent's position, divided by the grid size
+    - its direction, one-hot
+    - the offset from the agent to the goal
+    - the offsets to the `num_nearest` closest obstacles, nearest first
+
+    Offsets are in grid coordinates, divided by the grid size. The features
+    come straight from the position arrays, so building them never touches
+    the occupancy grid.
+    """
+
+    def __init__(self, size, n_obstacles, num_nearest=4):
+        self.scale = 1.0 / size
+        self.goal = np.array([size - 2, size - 2], dtype=np.int64)
+        self.num_nearest = min(num_nearest, n_obstacles)
+        self.size = 2 + 4 + 2 + 2 * self.num_nearest
+
+    def __call__(self, agent_pos, agent_dir, obstacles, out=None):
+        """
+        Observations for `len(agent_pos)` envs: `agent_pos` `(n, 2)`,
+        `agent_dir` `(n,)`, `obstacles` `(n, n_obstacles, 2)`. Returns (or
+        fills `out` with) `(n, size)` float32.
+        """
+        count = len(agent_pos)
+        if out is None:
+            out = np.empty((count, self.size), dtype=np.float32)
+
+        dx = obstacles[:, :, 0] - agent_pos[:, :1]
+        dy = obstacles[:, :, 1] - agent_pos[:, 1:]
+        # stable, so ties keep the obstacles' order and the vector is deterministic
+        nearest = np.argsort(dx * dx + dy * dy, axis=1, kind="stable")[:, :self.num_nearest]
+        rows = np.arange(count)[:, None]
+
+        out[:, 0:2] = agent_pos * self.scale
+        out[:, 2:6] = agent_dir[:, None] == np.arange(4)
+        out[:, 6:8] = (self.goal - agent_pos) * self.scale
+        out[:, 8::2] = dx[rows, nearest] * self.scale
+        out[:, 9::2] = dy[rows, nearest] * self.scale
+        return out
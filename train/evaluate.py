@@ -0,0 +1,172 @@
+import json
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+import numpy as np
+import torch
+import tyro
+
+from ImageEncoder import ImageEncoder
+from ppo import Actor
+from ppo_envs import VECTORIZED_ENVS
+from RunningMeanStd import RunningMeanStd
+
+
+@dataclass
+class EvaluateArgs:
+    model_path: str = 'models/actor.pth'
+    """an `actor.pth` state dict or an `.onnx` graph exported by torch2onnx.py"""
+    env_id: str = "LevelTwo"
+    """the id of the environment (any env with a batch engine in `ppo_envs.VECTORIZED_ENVS`)"""
+    num_episodes: int = 4096
+    """episodes per mode, split evenly over the envs (rounded up to a multiple of `num_envs`)"""
+    num_envs: int = 256
+    """the number of environments stepped together"""
+    mode: Literal["greedy", "sampled", "both"] = "both"
+    """take the most likely action, sample from the policy, or report both (only sampled for graphs that sample inside)"""
+    seed: int = 1
+    """seed of the environments and of the sampled actions"""
+    max_episode_steps: int = 1000
+    """episodes still running after this many steps are cut off (LevelOne has no time limit)"""
+    report_path: Optional[str] = None
+    """if set, also write the report as JSON to this path"""
+
+
+class TorchPolicy:
+    supports_greedy = True
+
+    def __init__(self, path, envs):
+        state_dict = torch.load(path, map_location="cpu")
+        # actors trained with --norm-obs carry their observation statistics
+        obs_rms = RunningMeanStd(envs.single_observation_space.shape) if "obs_rms.mean" in state_dict else None
+        encoder = ImageEncoder(envs.single_observation_space.shape[0]) if any(k.startswith("encoder.") for k in state_dict) else None
+        self.actor = Actor(envs, obs_rms, encoder)
+        self.actor.load_state_dict(state_dict)
+        self.actor.eval()
+
+    @torch.no_grad()
+    def __call__(self, obs, greedy, generator):
+        logits = self.actor(torch.from_numpy(obs).float())
+        if greedy:
+            return logits.argmax(dim=1).numpy()
+        return torch.multinomial(torch.softmax(logits, dim=1), 1, generator=generator).flatten().numpy()
+
+
+class OnnxPolicy:
+    """
+    Runs an exported graph with onnxruntime. Graphs that output logits support
+    both modes; graphs that sample inside (torch2onnx.py's `action` output)
+    only support sampled evaluation.
+    """
+
+    def __init__(self, path):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.outputs_actions = "int" in self.session.get_outputs()[0].type
+        self.supports_greedy = not self.outputs_actions
+
+    def __call__(self, obs, greedy, generator):
+        output = self.session.run(None, {self.input_name: obs.astype(np.float32)})[0]
+        if self.outputs_actions:
+            if greedy:
+                raise ValueError("this graph samples its own actions, greedy evaluation needs logits or actor.pth")
+            return output.reshape(-1).astype(np.int64)
+        logits = torch.from_numpy(output)
+        if greedy:
+            return logits.argmax(dim=1).numpy()
+        return torch.multinomial(torch.softmax(logits, dim=1), 1, generator=generator).flatten().numpy()
+
+
+def run_episodes(envs, policy, greedy, episodes_per_env, max_episode_steps, seed):
+    """Step `envs` until every env has finished `episodes_per_env` episodes; returns per-episode arrays."""
+    num_envs = envs.num_envs
+    generator = torch.Generator().manual_seed(seed)
+    obs, _ = envs.reset(seed=seed)
+
+    episode_return = np.zeros(num_envs)
+    episode_apples = np.zeros(num_envs, dtype=np.int64)
+    episode_length = np.zeros(num_envs, dtype=np.int64)
+    finished = np.zeros(num_envs, dtype=np.int64)
+    results = {name: [] for name in ("return", "apples", "length", "collision", "truncated")}
+
+    while finished.min() < episodes_per_env:
+        obs, reward, terminations, truncations, infos = envs.step(policy(obs, greedy, generator))
+        episode_return += reward
+        # DynamicObstacles has no apples
+        episode_apples += infos.get("apple", 0)
+        episode_length += 1
+
+        cut_off = (episode_length >= max_episode_steps) & ~terminations
+        done = terminations | truncations | cut_off
+        # envs past their quota keep stepping (the batch moves together) but are no longer recorded
+        record = done & (finished < episodes_per_env)
+        for name, values in (
+            ("return", episode_return),
+            ("apples", episode_apples),
+            ("length", episode_length),
+            ("collision", infos["collision"]),
+            ("truncated", (truncations | cut_off) & ~infos["collision"]),
+        ):
+            results[name].append(values[record].copy())
+
+        finished += done
+        episode_return[done] = 0
+        episode_apples[done] = 0
+        episode_length[done] = 0
+        if cut_off.any():
+            envs.reset_envs(np.flatnonzero(cut_off))
+            obs = envs.observation.copy()
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def summarize(results, elapsed):
+    returns = results["return"]
+    percentiles = np.percentile(returns, [5, 25, 50, 75, 95])
+    return {
+        "episodes": len(returns),
+        "return_mean": float(returns.mean()),
+        "return_std": float(returns.std()),
+        **{f"return_p{p}": float(value) for p, value in zip((5, 25, 50, 75, 95), percentiles)},
+        "apples_per_episode": float(results["apples"].mean()),
+        "collision_rate": float(results["collision"].mean()),
+        "timeout_rate": float(results["truncated"].mean()),
+        "episode_length": float(results["length"].mean()),
+        "episodes_per_sec": len(returns) / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    args = tyro.cli(EvaluateArgs)
+    torch.set_grad_enabled(False)
+    envs = VECTORIZED_ENVS[args.env_id](args.num_envs, seed=args.seed)
+    policy = OnnxPolicy(args.model_path) if args.model_path.endswith(".onnx") else TorchPolicy(args.model_path, envs)
+    episodes_per_env = -(-args.num_episodes // args.num_envs)
+
+    modes = ["greedy", "sampled"] if args.mode == "both" else [args.mode]
+    if not policy.supports_greedy and "greedy" in modes:
+        if args.mode == "greedy":
+            raise SystemExit(f"{args.model_path} samples its own actions, greedy evaluation needs a logits graph or actor.pth")
+        warnings.warn(f"{args.model_path} samples its own actions, reporting sampled evaluation only")
+        modes = ["sampled"]
+
+    report = {}
+    for mode in modes:
+        start = time.perf_counter()
+        results = run_episodes(envs, policy, mode == "greedy", episodes_per_env, args.max_episode_steps, args.seed)
+        report[mode] = summarize(results, time.perf_counter() - start)
+
+    print(f"{args.model_path} on {args.env_id}")
+    for mode, summary in report.items():
+        print(f"\n{mode}:")
+        for name, value in summary.items():
+            print(f"  {name:<20}{value:>12.3f}" if isinstance(value, float) else f"  {name:<20}{value:>12}")
+
+    if args.report_path is not None:
+        with open(args.report_path, "w") as f:
+            json.dump({"model_path": args.model_path, "env_id": args.env_id, **report}, f, indent=2)
+    envs.close()
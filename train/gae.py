@@ -0,0 +1,120 @@
+import time
+
+import torch
+
+
+def compute_gae_reference(rewards, values, dones, next_value, next_done, gamma: float, gae_lambda: float):
+    """
+    Textbook reverse-loop GAE over `(num_steps, num_envs)` tensors.
+
+    `dones[t]` flags that `obs[t]` starts a new episode, `next_value` and
+    `next_done` describe the observation after the last step. Returns
+    `(advantages, returns)`. Kept as the reference `compute_gae` is checked
+    against.
+    """
+    num_steps = rewards.shape[0]
+    next_value = next_value.reshape(-1)
+    next_done = next_done.reshape(-1)
+
+    advantages = torch.zeros_like(rewards)
+    lastgaelam = torch.zeros_like(next_value)
+    for t in reversed(range(num_steps)):
+        if t == num_steps - 1:
+            nextnonterminal = 1.0 - next_done
+            nextvalues = next_value
+        else:
+            nextnonterminal = 1.0 - dones[t + 1]
+            nextvalues = values[t + 1]
+        delta = rewards[t] + gamma * nextvalues * nextnonterminal - values[t]
+        lastgaelam = delta + gamma * gae_lambda * nextnonterminal * lastgaelam
+        advantages[t] = lastgaelam
+    return advantages, advantages + values
+
+
+def gae_workspace(rewards):
+    """Zeroed scratch for `compute_gae` on tensors shaped like `rewards`, reusable across calls."""
+    return rewards.new_zeros((4, 2 * rewards.shape[0]) + tuple(rewards.shape[1:]))
+
+
+def compute_gae(rewards, values, dones, next_value, next_done, gamma: float, gae_lambda: float, advantages=None, returns=None, workspace=None):
+    """
+    Same result as `compute_gae_reference` without a per-step loop.
+
+    The recurrence `A_t = delta_t + decay_t * A_{t+1}` composes associatively
+    over `(decay, delta)` pairs, so a reverse Hillis-Steele scan finishes in
+    ceil(log2(num_steps)) whole-tensor steps, e.g. 11 for 2048 steps. Each
+    step is one `addcmul` and one `mul` into a preallocated `workspace`
+    (from `gae_workspace`): ping-pong buffers twice the rollout long whose
+    second half stays zero, so the shifted reads near the end of the rollout
+    need no special case. Results go into `advantages` and `returns` when
+    given; nothing is allocated per scan step.
+    """
+    num_steps = rewards.shape[0]
+    if workspace is None:
+        workspace = gae_workspace(rewards)
+    if advantages is None:
+        advantages = torch.empty_like(rewards)
+    if returns is None:
+        returns = torch.empty_like(rewards)
+    current, scratch, decay, decay_scratch = workspace.unbind(0)
+    rollout = slice(0, num_steps)
+
+    # next_nonterminal, then the TD residuals
+    decay[:num_steps - 1] = dones[1:]
+    decay[num_steps - 1] = next_done.reshape(-1)
+    decay[rollout].neg_().add_(1.0)
+    current[:num_steps - 1] = values[1:]
+    current[num_steps - 1] = next_value.reshape(-1)
+    current[rollout].mul_(decay[rollout]).mul_(gamma).add_(rewards).sub_(values)
+    decay[rollout].mul_(gamma * gae_lambda)
+
+    offset = 1
+    while offset < num_steps:
+        shifted = slice(offset, offset + num_steps)
+        torch.addcmul(current[rollout], decay[rollout], current[shifted], out=scratch[rollout])
+        torch.mul(decay[rollout], decay[shifted], out=decay_scratch[rollout])
+        current, scratch = scratch, current
+        decay, decay_scratch = decay_scratch, decay
+        offset *= 2
+
+    advantages.copy_(current[rollout])
+    torch.add(advantages, values, out=returns)
+    return advantages, returns
+
+
+if __name__ == "__main__":
+    # agreement and timing check: python gae.py
+    from ppo_update import compile_with_fallback
+
+    compiled_gae = compile_with_fallback(compute_gae)
+    torch.manual_seed(0)
+    for num_steps, num_envs in [(1, 4), (2, 3), (127, 5), (128, 16), (2048, 16), (4096, 64)]:
+        rewards = torch.randn(num_steps, num_envs, dtype=torch.float64)
+        values = torch.randn(num_steps, num_envs, dtype=torch.float64)
+        dones = (torch.rand(num_steps, num_envs) < 0.02).double()
+        next_value = torch.randn(num_envs, dtype=torch.float64)
+        workspace = gae_workspace(rewards)
+        for next_done in (torch.zeros(num_envs, dtype=torch.float64), torch.ones(num_envs, dtype=torch.float64)):
+            expected = compute_gae_reference(rewards, values, dones, next_value, next_done, 0.99, 0.95)
+            # twice through one workspace, so a dirty workspace would show
+            for _ in range(2):
+                actual = compute_gae(rewards, values, dones, next_value, next_done, 0.99, 0.95, workspace=workspace)
+                for name, a, b in zip(("advantages", "returns"), actual, expected):
+                    assert torch.allclose(a, b, rtol=1e-9, atol=1e-9), f"{name} differ for {num_steps}x{num_envs}: {(a - b).abs().max()}"
+
+        # timed in float32 into preallocated outputs, the way RolloutBuffer calls it
+        args = [x.float() for x in (rewards, values, dones, next_value, next_done)] + [0.99, 0.95]
+        outputs = dict(advantages=torch.empty(num_steps, num_envs), returns=torch.empty(num_steps, num_envs), workspace=gae_workspace(args[0]))
+        compiled_gae(*args, **outputs)
+        compiled = outputs["advantages"].clone()
+        compute_gae(*args, **outputs)
+        assert torch.allclose(compiled, outputs["advantages"], rtol=1e-4, atol=1e-4), f"compiled scan differs for {num_steps}x{num_envs}"
+
+        timings = {}
+        for name, fn, kwargs in [("reference", compute_gae_reference, {}), ("scan", compute_gae, outputs), ("compiled", compiled_gae, outputs)]:
+            start = time.perf_counter()
+            for _ in range(10):
+                fn(*args, **kwargs)
+            timings[name] = (time.perf_counter() - start) / 10
+        print(f"num_steps={num_steps} num_envs={num_envs} " + " ".join(f"{name}={seconds * 1e6:.0f}us" for name, seconds in timings.items()))
+    print("compute_gae matches compute_gae_reference")
@@ -0,0 +1,152 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import tyro
+
+from Checkpointer import atomic_save, latest_checkpoint, load_checkpoint
+
+
+# name -> (low, high, log scale) of the range each hyperparameter is sampled and clipped to
+SEARCH_SPACE = {
+    "learning_rate": (1e-5, 1e-3, True),
+    "ent_coef": (1e-4, 0.05, True),
+    "clip_coef": (0.05, 0.4, False),
+    "gae_lambda": (0.8, 0.999, False),
+}
+
+
+@dataclass
+class PBTArgs:
+    population_size: int = 8
+    """the number of PPO runs trained side by side"""
+    num_workers: int = 4
+    """how many runs train at the same time"""
+    iterations_per_generation: int = 10
+    """PPO iterations each run trains between two exploit/explore steps"""
+    exploit_fraction: float = 0.25
+    """the bottom fraction of the population is replaced by copies of the top fraction"""
+    perturb_factors: Tuple[float, ...] = (0.8, 1.25)
+    """an exploited run multiplies each hyperparameter by one of these"""
+    resample_probability: float = 0.25
+    """probability of resampling a hyperparameter from `SEARCH_SPACE` instead of perturbing it"""
+    pbt_dir: str = 'models/pbt'
+    """every run gets `<pbt_dir>/member_<i>`, the schedule is logged to `<pbt_dir>/history.jsonl`"""
+    seed: int = 1
+    """seed of the scheduler, run `i` trains with seed `seed + i`"""
+    ppo_args: str = ''
+    """extra arguments for every ppo.py run, passed as --ppo-args='--total-timesteps 500000 --vectorized-env';
+    runs are untracked unless this holds --track, and wandb then logs offline"""
+
+
+def sample(rng, name):
+    low, high, log = SEARCH_SPACE[name]
+    if log:
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    return float(rng.uniform(low, high))
+
+
+def explore(rng, hyperparameters, args):
+    explored = {}
+    for name, value in hyperparameters.items():
+        if rng.random() < args.resample_probability:
+            explored[name] = sample(rng, name)
+        else:
+            low, high, _ = SEARCH_SPACE[name]
+            explored[name] = float(np.clip(value * rng.choice(args.perturb_factors), low, high))
+    return explored
+
+
+def member_dir(args, member):
+    return os.path.join(args.pbt_dir, f"member_{member}")
+
+
+def train_segment(args, member, hyperparameters, stop_iteration):
+    """Run ppo.py for member `member` up to `stop_iteration`, resuming from its last checkpoint."""
+    directory = member_dir(args, member)
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ppo.py"),
+        "--exp-name", f"pbt_member_{member}",
+        "--seed", str(args.seed + member),
+        "--checkpoint-dir", os.path.join(directory, "checkpoints"),
+        "--checkpoint-interval", str(args.iterations_per_generation),
+        "--stop-iteration", str(stop_iteration),
+        "--model-path", os.path.join(directory, "model.pth"),
+        "--optimizer-path", os.path.join(directory, "optimizer.pth"),
+        "--actor-path", os.path.join(directory, "actor.pth"),
+    ]
+    command += [f"--{name.replace('_', '-')}={value}" for name, value in hyperparameters.items()]
+    if latest_checkpoint(os.path.join(directory, "checkpoints")) is not None:
+        command.append("--resume")
+    # before `ppo_args`, so an explicit --track there still wins
+    command.append("--no-track")
+    command += shlex.split(args.ppo_args)
+
+    with open(os.path.join(directory, "train.log"), "a") as log:
+        subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, check=True, env={**os.environ, "WANDB_MODE": "offline"})
+    return load_checkpoint(latest_checkpoint(os.path.join(directory, "checkpoints")))
+
+
+def exploit(args, winner, loser):
+    # the loser continues from the winner's weights, optimizer and normalizer stats; without the
+    # winner's RNG state it draws its own actions instead of replaying the winner's
+    state = load_checkpoint(latest_checkpoint(os.path.join(member_dir(args, winner), "checkpoints")))
+    del state["rng"]
+    loser_checkpoint = os.path.join(member_dir(args, loser), "checkpoints", f"checkpoint_{state['iteration']:08d}.pt")
+    atomic_save(state, loser_checkpoint)
+
+
+if __name__ == "__main__":
+    args = tyro.cli(PBTArgs)
+    rng = np.random.default_rng(args.seed)
+    for member in range(args.population_size):
+        os.makedirs(member_dir(args, member), exist_ok=True)
+
+    population = [{name: sample(rng, name) for name in SEARCH_SPACE} for _ in range(args.population_size)]
+    num_exploited = max(1, int(args.population_size * args.exploit_fraction))
+    history_path = os.path.join(args.pbt_dir, "history.jsonl")
+
+    generation = 0
+    with ThreadPoolExecutor(max_workers=args.num_workers) as pool:
+        while True:
+            generation += 1
+            stop_iteration = generation * args.iterations_per_generation
+            futures = [pool.submit(train_segment, args, member, population[member], stop_iteration) for member in range(args.population_size)]
+            states = [future.result() for future in futures]
+            rewards = [state["recent_reward"] for state in states]
+            ranking = np.argsort(rewards)[::-1]
+
+            finished = states[0]["iteration"] >= states[0]["num_iterations"]
+            print(f"generation {generation}: iteration {states[0]['iteration']}/{states[0]['num_iterations']}, "
+                  f"best reward {rewards[ranking[0]]:.3f} (member {ranking[0]})")
+
+            used = [dict(hyperparameters) for hyperparameters in population]
+            sources = {}
+            if not finished:
+                for loser in ranking[-num_exploited:]:
+                    winner = int(rng.choice(ranking[:num_exploited]))
+                    exploit(args, winner, loser)
+                    population[loser] = explore(rng, used[winner], args)
+                    sources[int(loser)] = winner
+
+            with open(history_path, "a") as history:
+                for member in range(args.population_size):
+                    history.write(json.dumps({
+                        "generation": generation,
+                        "iteration": states[member]["iteration"],
+                        "member": member,
+                        "reward": rewards[member],
+                        "copied_from": sources.get(member),
+                        "hyperparameters": used[member],
+                    }) + "\n")
+
+            if finished:
+                break
+
+    print(f"best member: {ranking[0]} with {population[ranking[0]]}, weights in {member_dir(args, ranking[0])}")
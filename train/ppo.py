@@ -1,10 +1,30 @@
 import os
 import random
 import time
+from collections import deque
 from dataclasses import dataclass
-
-from LevelOneEnv import LevelOneEnv
-from LevelTwoEnv import LevelTwoEnv
+from typing import Literal, Optional
+
+from ImageEncoder import ImageEncoder
+from FusedPolicy import FusedPolicy
+from RolloutBuffer import RolloutBuffer
+from RolloutCollector import RolloutCollector
+from MetricsAccumulator import MetricsAccumulator
+from Checkpointer import Checkpointer, set_rng_state
+from RunningMeanStd import ReturnNormalizer, RunningMeanStd
+from ppo_update import (
+    LOSS_METRICS,
+    compile_with_fallback,
+    explained_variance,
+    next_update_epochs,
+    optimizer_step,
+    ppo_loss,
+    relabel_logprobs,
+    set_learning_rate,
+)
+from PipelinedCollector import PipelinedCollector
+from ppo_checkpoint import checkpoint_state, load_saved_model, resume, resume_seed, save_model
+from ppo_envs import make_envs
 
 import gymnasium as gym
 import numpy as np
@@ -38,6 +58,34 @@ class Args:
     """the entity (team) of wandb's project"""
     capture_video: bool = False
     """whether to capture videos of the agent performances (check out `videos` folder)"""
+    vectorized_env: bool = False
+    """if toggled, step all envs with the array-based batch engine instead of `SyncVectorEnv`"""
+    torch_env: bool = False
+    """if toggled, step the envs with torch tensor ops on the training device (overrides `vectorized_env`)"""
+    num_workers: int = 0
+    """if > 0, step the envs in this many worker processes that write into shared memory"""
+    pipelined: bool = False
+    """if toggled, collect the next rollout in a background thread while training on the previous one (one iteration of policy lag; with `target_kl`, the ratio and KL are taken against the policy at the start of the update)"""
+    compile: bool = False
+    """if toggled, `torch.compile` the PPO loss (with the agent's forward and backward), the optimizer step and the GAE scan, falling back to eager on failure"""
+    norm_obs: bool = False
+    """if toggled, normalize observations with running statistics (saved in the model and exported by torch2onnx.py)"""
+    norm_reward: bool = False
+    """if toggled, scale rewards by the running std of the discounted return"""
+    encoder: Literal["mlp", "cnn"] = "mlp"
+    """`cnn` puts a small CNN (ImageEncoder.py) in front of the actor and critic MLPs, for DynamicObstacles' flat image + direction observations"""
+    checkpoint_dir: str = 'models/checkpoints'
+    """where the periodic resumable checkpoints are written"""
+    checkpoint_interval: int = 0
+    """write a resumable checkpoint every this many iterations (0 disables)"""
+    keep_checkpoints: int = 3
+    """how many of the most recent checkpoints to keep (0 keeps all)"""
+    resume: bool = False
+    """if toggled, continue the run from the latest checkpoint in `checkpoint_dir`"""
+    stop_iteration: int = 0
+    """if > 0, checkpoint and stop after this iteration, so a scheduler (pbt.py) can continue the run later with `resume`"""
+    log_interval: int = 1
+    """copy the metrics to the host and log them (averaged) every this many iterations"""
 
     # Algorithm specific arguments
     env_id: str = "LevelTwo"
@@ -72,8 +120,10 @@ class Args:
     """coefficient of the value function"""
     max_grad_norm: float = 0.5
     """the maximum norm for the gradient clipping"""
-    # target_kl: float = None
-    # """the target KL divergence threshold"""
+    target_kl: Optional[float] = None
+    """the target KL divergence threshold, the update stops at the first minibatch whose approx_kl exceeds it"""
+    adaptive_epochs: bool = False
+    """if toggled, size the next update (up to `update_epochs`) from the KL per epoch of this one (needs `target_kl`)"""
 
     # to be filled in runtime
     batch_size: int = 0
@@ -84,28 +134,21 @@ class Args:
     """the number of iterations (computed in runtime)"""
 
 
-def make_env(env_id, idx, capture_video, run_name):
-    def thunk():
-        if capture_video and idx == 0:
-            env = gym.make(env_id, render_mode="rgb_array")
-            env = gym.wrappers.RecordVideo(env, f"videos/{run_name}")
-        else:
-            env = gym.make(env_id)
-        return env
-
-    return thunk
-
-
 def layer_init(layer, std=np.sqrt(2), bias_const=0.0):
     torch.nn.init.orthogonal_(layer.weight, std)
     torch.nn.init.constant_(layer.bias, bias_const)
     return layer
 
+def encoder_features(envs, encoder):
+    return encoder.out_features if encoder is not None else np.array(envs.single_observation_space.shape).prod()
+
 class Actor(nn.Module):
-    def __init__(self, envs):
+    def __init__(self, envs, obs_rms=None, encoder=None):
         super().__init__()
+        self.obs_rms = obs_rms if obs_rms is not None else nn.Identity()
+        self.encoder = encoder if encoder is not None else nn.Identity()
         self.actor = nn.Sequential(
-            layer_init(nn.Linear(np.array(envs.single_observation_space.shape).prod(), 64)),
+            layer_init(nn.Linear(encoder_features(envs, encoder), 64)),
             nn.Tanh(),
             layer_init(nn.Linear(64, 64)),
             nn.Tanh(),
@@ -113,13 +156,15 @@ class Actor(nn.Module):
         )
 
     def forward(self, x):
-        return self.actor(x)
+        return self.actor(self.encoder(self.obs_rms(x)))
     
 class Critic(nn.Module):
-    def __init__(self, envs):
+    def __init__(self, envs, obs_rms=None, encoder=None):
         super().__init__()
+        self.obs_rms = obs_rms if obs_rms is not None else nn.Identity()
+        self.encoder = encoder if encoder is not None else nn.Identity()
         self.critic = nn.Sequential(
-            layer_init(nn.Linear(np.array(envs.single_observation_space.shape).prod(), 64)),
+            layer_init(nn.Linear(encoder_features(envs, encoder), 64)),
             nn.Tanh(),
             layer_init(nn.Linear(64, 64)),
             nn.Tanh(),
@@ -127,13 +172,19 @@ class Critic(nn.Module):
         )
 
     def forward(self, x):
-        return self.critic(x)
+        return self.critic(self.encoder(self.obs_rms(x)))
 
 class Agent(nn.Module):
-    def __init__(self, envs):
+    def __init__(self, envs, norm_obs=False, norm_reward=False, encoder="mlp"):
         super().__init__()
-        self.critic = Critic(envs)
-        self.actor = Actor(envs)
+        # actor and critic share one set of observation statistics, but each has its own encoder
+        obs_rms = RunningMeanStd(envs.single_observation_space.shape) if norm_obs else None
+        obs_size = envs.single_observation_space.shape[0]
+        self.critic = Critic(envs, obs_rms, ImageEncoder(obs_size) if encoder == "cnn" else None)
+        self.actor = Actor(envs, obs_rms, ImageEncoder(obs_size) if encoder == "cnn" else None)
+        self.return_normalizer = ReturnNormalizer() if norm_reward else None
+        # rollout-only inference path, not a submodule so it stays out of the state dict
+        self.fused = FusedPolicy(self)
 
     def get_value(self, x):
         return self.critic(x)
@@ -144,6 +195,10 @@ class Agent(nn.Module):
         if action is None:
             action = probs.sample()
         return action, probs.log_prob(action), probs.entropy(), self.critic(x)
+
+    def act(self, x):
+        # sampled action, its log-prob and the value in one pass, without gradients
+        return self.fused(x)
     
     def get_action(self, x):
         logits = self.actor(x)
@@ -185,193 +240,134 @@ if __name__ == "__main__":
     device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
 
     # env setup
-    envs = gym.vector.SyncVectorEnv(
-        [make_env(args.env_id, i, args.capture_video, run_name) for i in range(args.num_envs)],
-    )
+    envs = make_envs(args, run_name, device)
     assert isinstance(envs.single_action_space, gym.spaces.Discrete), "only discrete action space is supported"
 
-    agent = Agent(envs).to(device)
+    assert not (args.encoder == "cnn" and args.norm_obs), "the cnn encoder reads raw cell codes, it does not take norm_obs"
+    agent = Agent(envs, args.norm_obs, args.norm_reward, args.encoder).to(device)
     optimizer = optim.Adam(agent.parameters(), lr=args.learning_rate, eps=1e-5)
 
-    if os.path.exists(args.model_path):
-        print(f'loading saved model from {args.model_path}')
-        agent.load_state_dict(torch.load(args.model_path))
-        agent.eval()
+    load_saved_model(args, agent, optimizer)
 
-        if os.path.exists(args.optimizer_path):
-            print(f'loading saved optimizer state from {args.optimizer_path}')
-            optimizer.load_state_dict(torch.load(args.optimizer_path))
+    start_iteration, global_step, num_epochs = 1, 0, args.update_epochs
+    resumed = resume(args, agent, optimizer) if args.resume else None
+    if resumed is not None:
+        start_iteration, global_step, num_epochs = resumed["iteration"] + 1, resumed["global_step"], resumed["num_epochs"]
+    checkpointer = Checkpointer(args.checkpoint_dir, args.keep_checkpoints) if args.checkpoint_interval > 0 else None
 
+    loss_fn, step_fn = ppo_loss, optimizer_step
+    if args.compile:
+        set_learning_rate(optimizer, torch.tensor(optimizer.param_groups[0]["lr"]))
+        loss_fn, step_fn = compile_with_fallback(ppo_loss), compile_with_fallback(optimizer_step)
 
     # ALGO Logic: Storage setup
-            
-    # [num_steps, num_envs, obs_shape]
-    obs = torch.zeros((args.num_steps, args.num_envs) + envs.single_observation_space.shape).to(device)
-    
-    # [num_steps, num_envs, action_shape]
-    actions = torch.zeros((args.num_steps, args.num_envs) + envs.single_action_space.shape).to(device)
-
-    # [num_steps, num_envs] (denotes chosen actions log probability)
-    logprobs = torch.zeros((args.num_steps, args.num_envs)).to(device)
-
-    # [num_steps, num_envs] (denotes the chosen action)
-    rewards = torch.zeros((args.num_steps, args.num_envs)).to(device)
-
-    # [num_steps, num_envs] (denotes whether the trajectory is done)
-    dones = torch.zeros((args.num_steps, args.num_envs)).to(device)
-
-    # [num_steps, num_envs] 
-    values = torch.zeros((args.num_steps, args.num_envs)).to(device)
+    collector = RolloutCollector(envs, args.num_envs, device)
+    if args.pipelined:
+        # two buffers: one being filled by the collector thread, one being trained on
+        storages = [RolloutBuffer.from_envs(args.num_steps, envs, device, compile_gae=args.compile) for _ in range(2)]
+        pipeline = PipelinedCollector(collector, agent, storages)
+    else:
+        storages = [RolloutBuffer.from_envs(args.num_steps, envs, device, compile_gae=args.compile)]
+        storage, = storages
+    print(f"rollout buffers (x{len(storages)}):\n{storages[0].memory_report()}")
+
+    assert args.target_kl is not None or not args.adaptive_epochs, "adaptive_epochs needs a target_kl"
+    metrics = MetricsAccumulator(LOSS_METRICS + ("losses/explained_variance", "charts/Reward", "charts/update_epochs"), device)
 
     # TRY NOT TO MODIFY: start the game
-    global_step = 0
+    start_step = global_step
     start_time = time.time()
-    next_obs, _ = envs.reset(seed=args.seed)
-    next_obs = torch.Tensor(next_obs).to(device)
-    next_done = torch.zeros(args.num_envs).to(device)
-
-    for iteration in (walrus:=trange(1, args.num_iterations + 1)):
+    collector.reset(seed=args.seed if resumed is None else resume_seed(args.seed, start_iteration))
+    if resumed is not None and "rng" in resumed:
+        # the envs restart from a fresh reset on a stream of their own, the policy's random streams carry on
+        set_rng_state(resumed["rng"])
+    recent_rewards = deque(maxlen=10)
+
+    # stop_iteration ends this segment early, the annealing schedule still runs to num_iterations
+    last_iteration = min(args.num_iterations, args.stop_iteration) if args.stop_iteration > 0 else args.num_iterations
+    for iteration in (walrus:=trange(start_iteration, last_iteration + 1)):
         # Annealing the rate if instructed to do so.
         if args.anneal_lr:
             frac = 1.0 - (iteration - 1.0) / args.num_iterations
             lrnow = frac * args.learning_rate
-            optimizer.param_groups[0]["lr"] = lrnow
-
-        for step in range(0, args.num_steps):
-            global_step += args.num_envs
-            obs[step] = next_obs
-            dones[step] = next_done
+            set_learning_rate(optimizer, lrnow)
 
-            # ALGO LOGIC: action logic
-            with torch.no_grad():
-                action, logprob, _, value = agent.get_action_and_value(next_obs)
-                values[step] = value.flatten()
-            actions[step] = action
-            logprobs[step] = logprob
-
-            # TRY NOT TO MODIFY: execute the game and log data.
-            next_obs, reward, terminations, truncations, infos = envs.step(action.cpu().numpy())
+        if args.pipelined:
+            storage, policy_version = pipeline.next(agent, iteration - 1)
+            writer.add_scalar("charts/policy_lag", iteration - 1 - policy_version, global_step)
+        else:
+            collector.collect(agent, storage)
+        global_step += args.batch_size
 
-            next_done = np.logical_or(terminations, truncations)
-            rewards[step] = torch.tensor(reward).to(device).view(-1)
-            next_obs, next_done = torch.Tensor(next_obs).to(device), torch.Tensor(next_done).to(device)
+        rollout_reward = storage.rewards.sum(dim=0).mean()
+        metrics.add("charts/Reward", rollout_reward)
+        recent_rewards.append(rollout_reward)
+        if args.norm_reward:
+            agent.return_normalizer(storage.rewards, storage.dones, storage.next_done, args.gamma)
 
         # bootstrap value if not done
         with torch.no_grad():
             # Get estimated value for the next state
-            next_value = agent.get_value(next_obs).reshape(1, -1)
-            
-            # Initialize advantages tensor
-            advantages = torch.zeros_like(rewards).to(device)
-
-            # Initialize last GAE value
-            lastgaelam = 0
-            
-            # Iterate over timesteps in reverse order
-            for t in reversed(range(args.num_steps)):
-                # Determine nextnonterminal and nextvalues based on timestep
-                if t == args.num_steps - 1:
-                    nextnonterminal = 1.0 - next_done
-                    nextvalues = next_value
-                else:
-                    nextnonterminal = 1.0 - dones[t + 1]
-                    nextvalues = values[t + 1]
-                
-                # Calculate TD error
-                delta = rewards[t] + args.gamma * nextvalues * nextnonterminal - values[t]
-                
-                # Calculate GAE and update last GAE value
-                lastgaelam = delta + args.gamma * args.gae_lambda * nextnonterminal * lastgaelam
-                
-                advantages[t] = delta + args.gamma * args.gae_lambda * nextnonterminal * lastgaelam
-    
-            # Calculate returns
-            returns = advantages + values
+            next_value = agent.get_value(storage.next_obs.float()).reshape(1, -1)
+            storage.compute_advantages(next_value, args.gamma, args.gae_lambda)
 
-        # flatten the batch
-        b_obs = obs.reshape((-1,) + envs.single_observation_space.shape)
-        b_logprobs = logprobs.reshape(-1)
-        b_actions = actions.reshape((-1,) + envs.single_action_space.shape)
-        b_advantages = advantages.reshape(-1)
-        b_returns = returns.reshape(-1)
-        b_values = values.reshape(-1)
+        if args.pipelined and args.target_kl is not None:
+            # the batch came from last iteration's snapshot, whose KL to the learner alone can exceed
+            # target_kl and stop every update before its first step: anchor the update at the current policy
+            relabel_logprobs(agent, storage, args.minibatch_size)
 
         # Optimizing the policy and value network
-        b_inds = np.arange(args.batch_size)
-        clipfracs = []
-        for epoch in range(args.update_epochs):
-            np.random.shuffle(b_inds)
-            for start in range(0, args.batch_size, args.minibatch_size):
-                end = start + args.minibatch_size
-                mb_inds = b_inds[start:end]
-
-                _, newlogprob, entropy, newvalue = agent.get_action_and_value(b_obs[mb_inds], b_actions.long()[mb_inds])
-                logratio = newlogprob - b_logprobs[mb_inds]
-                ratio = logratio.exp()
-
-                with torch.no_grad():
-                    clipfracs += [((ratio - 1.0).abs() > args.clip_coef).float().mean().item()]
-
-                mb_advantages = b_advantages[mb_inds]
-                if args.norm_adv:
-                    mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
-
-                # Policy loss
-                pg_loss1 = -mb_advantages * ratio
-                pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - args.clip_coef, 1 + args.clip_coef)
-                pg_loss = torch.max(pg_loss1, pg_loss2).mean()
-
-                # Value loss
-                newvalue = newvalue.view(-1)
-                if args.clip_vloss:
-                    v_loss_unclipped = (newvalue - b_returns[mb_inds]) ** 2
-                    v_clipped = b_values[mb_inds] + torch.clamp(
-                        newvalue - b_values[mb_inds],
-                        -args.clip_coef,
-                        args.clip_coef,
-                    )
-                    v_loss_clipped = (v_clipped - b_returns[mb_inds]) ** 2
-                    v_loss_max = torch.max(v_loss_unclipped, v_loss_clipped)
-                    v_loss = 0.5 * v_loss_max.mean()
-                else:
-                    v_loss = 0.5 * ((newvalue - b_returns[mb_inds]) ** 2).mean()
-
-                entropy_loss = entropy.mean()
-                loss = pg_loss - args.ent_coef * entropy_loss + v_loss * args.vf_coef
+        updates, approx_kl = 0, 0.0
+        for epoch in range(num_epochs):
+            for mb in storage.minibatches(args.minibatch_size):
+                loss, loss_metrics = loss_fn(
+                    agent, mb, args.clip_coef, args.norm_adv, args.clip_vloss, args.ent_coef, args.vf_coef
+                )
+                metrics.add(LOSS_METRICS[0], loss_metrics)
+
+                # the KL of the policy so far, measured before stepping on this minibatch
+                if args.target_kl is not None:
+                    approx_kl = loss_metrics[LOSS_METRICS.index("losses/approx_kl")].item()
+                    if approx_kl > args.target_kl:
+                        break
 
                 optimizer.zero_grad()
                 loss.backward()
-                nn.utils.clip_grad_norm_(agent.parameters(), args.max_grad_norm)
-                optimizer.step()
-
-            # if args.target_kl is not None and approx_kl > args.target_kl:
-                # break
-
-        y_pred, y_true = b_values.cpu().numpy(), b_returns.cpu().numpy()
-        var_y = np.var(y_true)
-        # print(var_y)
-        explained_var = np.nan if var_y == 0 else 1 - np.var(y_true - y_pred) / var_y
-
-        walrus.set_description(f'reward: {rewards.sum(dim=0).mean().item()}')
-
-        # TRY NOT TO MODIFY: record rewards for plotting purposes
-        writer.add_scalar("charts/learning_rate", optimizer.param_groups[0]["lr"], global_step)
-        writer.add_scalar("losses/value_loss", v_loss.item(), global_step)
-        writer.add_scalar("losses/policy_loss", pg_loss.item(), global_step)
-        writer.add_scalar("losses/entropy", entropy_loss.item(), global_step)
-        # writer.add_scalar("losses/old_approx_kl", old_approx_kl.item(), global_step)
-        # writer.add_scalar("losses/approx_kl", approx_kl.item(), global_step)
-        writer.add_scalar("losses/clipfrac", np.mean(clipfracs), global_step)
-        writer.add_scalar("losses/explained_variance", explained_var, global_step)
-        # print("SPS:", int(global_step / (time.time() - start_time)))
-        writer.add_scalar("charts/SPS", int(global_step / (time.time() - start_time)), global_step)
-        writer.add_scalar("charts/Reward", rewards.sum(dim=0).mean().item(), global_step)
-        
-    
-    
-    torch.save(agent.actor.state_dict(), args.actor_path)
-    torch.save(agent.state_dict(), args.model_path)
-    torch.save(optimizer.state_dict(), args.optimizer_path)
+                step_fn(agent, optimizer, args.max_grad_norm)
+                updates += 1
+            else:
+                continue
+            break
+
+        epochs_done = updates / args.num_minibatches
+        metrics.add("charts/update_epochs", epochs_done)
+        if args.adaptive_epochs and epochs_done > 0:
+            num_epochs = next_update_epochs(approx_kl, epochs_done, args.target_kl, args.update_epochs)
+
+        metrics.add("losses/explained_variance", explained_variance(storage.values.flatten(), storage.returns.flatten()))
+        # fold this rollout in only now, so it was collected and trained on with the same statistics
+        if args.norm_obs:
+            agent.actor.obs_rms.update(storage.obs.flatten(0, 1).float())
+
+        stopping = iteration == last_iteration
+        if checkpointer is not None and (iteration % args.checkpoint_interval == 0 or stopping):
+            checkpointer.save(checkpoint_state(args, agent, optimizer, iteration, global_step, num_epochs, recent_rewards), iteration)
+
+        if iteration % args.log_interval == 0 or stopping:
+            # TRY NOT TO MODIFY: record rewards for plotting purposes
+            logged = metrics.flush()
+            walrus.set_description(f'reward: {logged["charts/Reward"]}')
+            for name, value in logged.items():
+                writer.add_scalar(name, value, global_step)
+            writer.add_scalar("charts/learning_rate", float(optimizer.param_groups[0]["lr"]), global_step)
+            writer.add_scalar("charts/SPS", int((global_step - start_step) / (time.time() - start_time)), global_step)
+
+    if args.pipelined:
+        pipeline.close()
+    if checkpointer is not None:
+        checkpointer.close()
+
+    save_model(args, agent, optimizer)
 
     envs.close()
     writer.close()
\ No newline at end of file
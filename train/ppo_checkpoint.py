@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import torch
+
+from Checkpointer import latest_checkpoint, load_checkpoint, rng_state
+from ppo_update import set_learning_rate
+
+
+def load_saved_model(args, agent, optimizer):
+    """Warm-start from `args.model_path` (and `args.optimizer_path`) when a previous run left them."""
+    if os.path.exists(args.model_path):
+        print(f'loading saved model from {args.model_path}')
+        agent.load_state_dict(torch.load(args.model_path))
+        agent.eval()
+
+        if os.path.exists(args.optimizer_path):
+            print(f'loading saved optimizer state from {args.optimizer_path}')
+            optimizer.load_state_dict(torch.load(args.optimizer_path))
+
+
+def resume(args, agent, optimizer):
+    """
+    Load the latest checkpoint in `args.checkpoint_dir` into `agent` and
+    `optimizer` and return it. The run keeps its original annealing schedule
+    (`args.num_iterations`), but the command line's learning rate wins, so a
+    scheduler can change it between segments.
+    """
+    checkpoint_path = latest_checkpoint(args.checkpoint_dir)
+    assert checkpoint_path is not None, f"no checkpoint to resume from in {args.checkpoint_dir}"
+    print(f'resuming from {checkpoint_path}')
+    resumed = load_checkpoint(checkpoint_path)
+    agent.load_state_dict(resumed["agent"])
+    optimizer.load_state_dict(resumed["optimizer"])
+    set_learning_rate(optimizer, args.learning_rate)
+    args.num_iterations = resumed["num_iterations"]
+    return resumed
+
+
+def resume_seed(seed, iteration):
+    """
+    Env seed for a run resumed before `iteration`. The envs restart from a
+    fresh reset, and reseeding them with `seed` again would replay the
+    layouts and apples of the first iteration, so every resume point gets
+    its own stream, still reproducible from the run's seed.
+    """
+    # 31 bits, so per-env and per-worker offsets added to it stay valid NumPy seeds
+    return int(np.random.SeedSequence([seed, iteration]).generate_state(1)[0] >> 1)
+
+
+def checkpoint_state(args, agent, optimizer, iteration, global_step, num_epochs, recent_rewards):
+    """Everything `resume` needs to continue the run after `iteration`, plus the recent reward pbt.py ranks runs by."""
+    return {
+        "agent": agent.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "iteration": iteration,
+        "global_step": global_step,
+        "num_iterations": args.num_iterations,
+        "num_epochs": num_epochs,
+        "rng": rng_state(),
+        "recent_reward": torch.stack(list(recent_rewards)).mean().item(),
+        "args": vars(args),
+    }
+
+
+def save_model(args, agent, optimizer):
+    torch.save(agent.actor.state_dict(), args.actor_path)
+    torch.save(agent.state_dict(), args.model_path)
+    torch.save(optimizer.state_dict(), args.optimizer_path)
@@ -0,0 +1,184 @@
+import os
+import random
+import time
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+import torch.optim as optim
+import tyro
+from torch.utils.tensorboard import SummaryWriter
+from tqdm import trange
+
+from AgentEnsemble import AgentEnsemble
+from Checkpointer import Checkpointer
+from MetricsAccumulator import MetricsAccumulator
+from RolloutBuffer import Minibatch, RolloutBuffer
+from RolloutCollector import RolloutCollector
+from ppo import Agent, Args
+from ppo_envs import make_envs
+from ppo_update import LOSS_METRICS, explained_variance, set_learning_rate
+
+
+@dataclass
+class EnsembleArgs(Args):
+    exp_name: str = os.path.basename(__file__)[: -len(".py")]
+    """the name of this experiment"""
+    seeds: Tuple[int, ...] = (1, 2, 3, 4)
+    """one ensemble member per seed, each with `num_envs` environments of its own"""
+    clip_coefs: Optional[Tuple[float, ...]] = None
+    """per-member surrogate clipping coefficients (defaults to `clip_coef` for every member)"""
+    ent_coefs: Optional[Tuple[float, ...]] = None
+    """per-member entropy coefficients (defaults to `ent_coef` for every member)"""
+    ensemble_dir: str = 'models/ensemble'
+    """per-seed `actor.pth`, `model.pth` and checkpoints are written to `<ensemble_dir>/seed_<seed>`"""
+
+
+def member_minibatches(storage, num_members, minibatch_size):
+    """
+    Like `RolloutBuffer.minibatches`, but every member shuffles and slices its
+    own envs' transitions, so each field is `[num_members, minibatch_size, ...]`.
+    """
+    fields = {}
+    for name in Minibatch._fields:
+        value = getattr(storage, name)
+        # [num_steps, num_members * envs, ...] -> [num_members, num_steps * envs, ...]
+        value = value.view(value.shape[0], num_members, -1, *value.shape[2:]).transpose(0, 1)
+        fields[name] = value.reshape(num_members, -1, *value.shape[3:])
+
+    batch_size = fields["logprobs"].shape[1]
+    permutation = torch.rand(num_members, batch_size, device=storage.storage.device).argsort(dim=1)
+    for name, value in fields.items():
+        index = permutation.view(num_members, batch_size, *([1] * (value.dim() - 2)))
+        fields[name] = torch.take_along_dim(value, index, dim=1)
+
+    for start in range(0, batch_size, minibatch_size):
+        end = start + minibatch_size
+        # uint8 observations become float one minibatch at a time
+        yield Minibatch(fields["obs"][:, start:end].float(), *(fields[name][:, start:end] for name in Minibatch._fields[1:]))
+
+
+def per_member(values, default, num_members):
+    values = values if values is not None else (default,) * num_members
+    assert len(values) == num_members, f"expected {num_members} values, got {len(values)}"
+    return torch.tensor(values, dtype=torch.float32)
+
+
+if __name__ == "__main__":
+    args = tyro.cli(EnsembleArgs)
+    assert not (args.norm_obs or args.norm_reward or args.pipelined or args.compile or args.target_kl), \
+        "ppo_ensemble.py does not support norm_obs, norm_reward, pipelined, compile or target_kl"
+    num_members = len(args.seeds)
+    envs_per_member = args.num_envs
+    args.batch_size = int(envs_per_member * args.num_steps)
+    args.minibatch_size = int(args.batch_size // args.num_minibatches)
+    args.num_iterations = args.total_timesteps // args.batch_size
+    run_name = f"{args.env_id}__{args.exp_name}__{'-'.join(map(str, args.seeds))}__{int(time.time())}"
+
+    writer = SummaryWriter(f"runs/{run_name}")
+    writer.add_text(
+        "hyperparameters",
+        "|param|value|\n|-|-|\n%s" % ("\n".join([f"|{key}|{value}|" for key, value in vars(args).items()])),
+    )
+
+    random.seed(args.seeds[0])
+    np.random.seed(args.seeds[0])
+    torch.manual_seed(args.seeds[0])
+    torch.backends.cudnn.deterministic = args.torch_deterministic
+
+    device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
+
+    # one batched env for every member's envs, laid out member-major
+    envs = make_envs(replace(args, num_envs=num_members * envs_per_member), run_name, device)
+    members = []
+    for seed in args.seeds:
+        torch.manual_seed(seed)
+        members.append(Agent(envs, encoder=args.encoder).to(device))
+    ensemble = AgentEnsemble(members)
+    optimizer = optim.Adam(ensemble.parameters(), lr=args.learning_rate, eps=1e-5)
+    clip_coefs = per_member(args.clip_coefs, args.clip_coef, num_members).to(device)
+    ent_coefs = per_member(args.ent_coefs, args.ent_coef, num_members).to(device)
+
+    seed_dirs = [os.path.join(args.ensemble_dir, f"seed_{seed}") for seed in args.seeds]
+    checkpointers = []
+    if args.checkpoint_interval > 0:
+        checkpointers = [Checkpointer(os.path.join(seed_dir, "checkpoints"), args.keep_checkpoints) for seed_dir in seed_dirs]
+
+    collector = RolloutCollector(envs, num_members * envs_per_member, device)
+    storage = RolloutBuffer.from_envs(args.num_steps, envs, device)
+    # every member's loss stats first, so one minibatch's [num_members, len(LOSS_METRICS)] stats are a single block
+    metric_names = [f"seed_{seed}/{name}" for seed in args.seeds for name in LOSS_METRICS]
+    metric_names += [f"seed_{seed}/{name}" for seed in args.seeds for name in ("losses/explained_variance", "charts/Reward")]
+    metrics = MetricsAccumulator(metric_names, device)
+
+    global_step = 0
+    start_time = time.time()
+    collector.reset(seed=args.seeds[0])
+
+    for iteration in (walrus:=trange(1, args.num_iterations + 1)):
+        if args.anneal_lr:
+            frac = 1.0 - (iteration - 1.0) / args.num_iterations
+            set_learning_rate(optimizer, frac * args.learning_rate)
+
+        collector.collect(ensemble, storage)
+        global_step += args.batch_size
+
+        with torch.no_grad():
+            next_value = ensemble.get_value(storage.next_obs.float()).reshape(1, -1)
+            storage.compute_advantages(next_value, args.gamma, args.gae_lambda)
+
+        for epoch in range(args.update_epochs):
+            for mb in member_minibatches(storage, num_members, args.minibatch_size):
+                losses, loss_metrics = ensemble.loss(mb, clip_coefs, ent_coefs, args.norm_adv, args.clip_vloss, args.vf_coef)
+                optimizer.zero_grad()
+                # the members share no parameters, so the summed loss gives each its own gradient
+                losses.sum().backward()
+                ensemble.clip_grad_norm_(args.max_grad_norm)
+                optimizer.step()
+                metrics.add(metric_names[0], loss_metrics.flatten())
+
+        values = storage.values.view(args.num_steps, num_members, -1).transpose(0, 1).flatten(1)
+        returns = storage.returns.view(args.num_steps, num_members, -1).transpose(0, 1).flatten(1)
+        rewards = storage.rewards.view(args.num_steps, num_members, -1).sum(dim=0).mean(dim=1)
+        for i, seed in enumerate(args.seeds):
+            metrics.add(f"seed_{seed}/losses/explained_variance", explained_variance(values[i], returns[i]))
+            metrics.add(f"seed_{seed}/charts/Reward", rewards[i])
+
+        if checkpointers and (iteration % args.checkpoint_interval == 0 or iteration == args.num_iterations):
+            for i, checkpointer in enumerate(checkpointers):
+                checkpointer.save({
+                    "agent": ensemble.member_state_dict(i),
+                    "optimizer": ensemble.member_optimizer_state_dict(optimizer, i),
+                    "iteration": iteration,
+                    "global_step": global_step,
+                    "num_iterations": args.num_iterations,
+                    "num_epochs": args.update_epochs,
+                    "args": {**vars(args), "seed": args.seeds[i]},
+                }, iteration)
+
+        if iteration % args.log_interval != 0 and iteration != args.num_iterations:
+            continue
+
+        logged = metrics.flush()
+        member_rewards = [logged[f"seed_{seed}/charts/Reward"] for seed in args.seeds]
+        walrus.set_description(f"reward: {' '.join(f'{reward:.2f}' for reward in member_rewards)}")
+        for name, value in logged.items():
+            writer.add_scalar(name, value, global_step)
+        writer.add_scalar("charts/learning_rate", float(optimizer.param_groups[0]["lr"]), global_step)
+        writer.add_scalar("charts/SPS", int(num_members * global_step / (time.time() - start_time)), global_step)
+
+    for checkpointer in checkpointers:
+        checkpointer.close()
+
+    # the same files ppo.py writes, once per seed
+    for i, seed_dir in enumerate(seed_dirs):
+        os.makedirs(seed_dir, exist_ok=True)
+        agent = members[i]
+        agent.load_state_dict(ensemble.member_state_dict(i))
+        torch.save(agent.actor.state_dict(), os.path.join(seed_dir, "actor.pth"))
+        torch.save(agent.state_dict(), os.path.join(seed_dir, "model.pth"))
+        torch.save(ensemble.member_optimizer_state_dict(optimizer, i), os.path.join(seed_dir, "optimizer.pth"))
+
+    envs.close()
+    writer.close()
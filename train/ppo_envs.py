@@ -0,0 +1,57 @@
+from functools import partial
+
+import gymnasium as gym
+from gymnasium.vector import AutoresetMode
+
+# imported for their gym registrations
+from LevelOneEnv import LevelOneEnv
+from LevelTwoEnv import LevelTwoEnv
+from DynamicObstacles import DynamicObstaclesEnv, FlatObservation
+from LevelOneVecEnv import LevelOneVecEnv
+from LevelTwoVecEnv import LevelTwoVecEnv
+from LevelTwoTorchEnv import LevelTwoTorchEnv
+from DynamicObstaclesVecEnv import DynamicObstaclesVecEnv
+from SharedMemoryVecEnv import SharedMemoryVecEnv
+
+
+def make_env(env_id, idx, capture_video, run_name):
+    def thunk():
+        if capture_video and idx == 0:
+            env = gym.make(env_id, render_mode="rgb_array")
+            env = gym.wrappers.RecordVideo(env, f"videos/{run_name}")
+        else:
+            env = gym.make(env_id)
+        if isinstance(env.observation_space, gym.spaces.Dict):
+            # minigrid envs: image and direction as one flat uint8 vector
+            env = FlatObservation(env)
+        return env
+
+    return thunk
+
+
+TORCH_ENVS = {
+    "LevelTwo": LevelTwoTorchEnv,
+}
+
+VECTORIZED_ENVS = {
+    "LevelOne": LevelOneVecEnv,
+    "LevelTwo": LevelTwoVecEnv,
+    "DynamicObstacles": DynamicObstaclesVecEnv,
+    "DynamicObstacles-16x16": partial(DynamicObstaclesVecEnv, size=16, n_obstacles=8),
+    "DynamicObstacles-Symbolic": partial(DynamicObstaclesVecEnv, observation_mode="symbolic"),
+    "DynamicObstacles-16x16-Symbolic": partial(DynamicObstaclesVecEnv, size=16, n_obstacles=8, observation_mode="symbolic"),
+}
+
+
+def make_envs(args, run_name, device="cpu"):
+    """The vector env for ppo.py's `Args`: a torch or batch engine when asked for and available, else one env per process or per loop slot."""
+    # the batch engines have no renderer, so video capture keeps the per-env path
+    if args.torch_env and args.env_id in TORCH_ENVS and not args.capture_video:
+        return TORCH_ENVS[args.env_id](args.num_envs, seed=args.seed, device=device)
+    if args.vectorized_env and args.env_id in VECTORIZED_ENVS and not args.capture_video:
+        return VECTORIZED_ENVS[args.env_id](args.num_envs, seed=args.seed)
+    env_fns = [make_env(args.env_id, i, args.capture_video, run_name) for i in range(args.num_envs)]
+    if args.num_workers > 0:
+        return SharedMemoryVecEnv(env_fns, num_workers=args.num_workers)
+    # the same autoreset as the batch engines, which the rollout's done flags assume
+    return gym.vector.SyncVectorEnv(env_fns, autoreset_mode=AutoresetMode.SAME_STEP)
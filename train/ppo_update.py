@@ -0,0 +1,173 @@
+import time
+import warnings
+
+import torch
+import torch.nn as nn
+
+
+# order of the stats `ppo_loss` returns alongside the loss
+LOSS_METRICS = (
+    "losses/policy_loss",
+    "losses/value_loss",
+    "losses/entropy",
+    "losses/old_approx_kl",
+    "losses/approx_kl",
+    "losses/clipfrac",
+)
+
+
+def ppo_loss(agent, mb, clip_coef: float, norm_adv: bool, clip_vloss: bool, ent_coef: float, vf_coef: float):
+    """
+    Clipped PPO objective for one `Minibatch`.
+
+    Returns `(loss, stats)`, where `stats` is a detached 1-D tensor ordered
+    like `LOSS_METRICS`, so callers can accumulate it without a host sync.
+    """
+    _, newlogprob, entropy, newvalue = agent.get_action_and_value(mb.obs, mb.actions.long())
+    logratio = newlogprob - mb.logprobs
+    ratio = logratio.exp()
+
+    mb_advantages = mb.advantages
+    if norm_adv:
+        mb_advantages = (mb_advantages - mb_advantages.mean()) / (mb_advantages.std() + 1e-8)
+
+    # Policy loss
+    pg_loss1 = -mb_advantages * ratio
+    pg_loss2 = -mb_advantages * torch.clamp(ratio, 1 - clip_coef, 1 + clip_coef)
+    pg_loss = torch.max(pg_loss1, pg_loss2).mean()
+
+    # Value loss
+    newvalue = newvalue.view(-1)
+    if clip_vloss:
+        v_loss_unclipped = (newvalue - mb.returns) ** 2
+        v_clipped = mb.values + torch.clamp(
+            newvalue - mb.values,
+            -clip_coef,
+            clip_coef,
+        )
+        v_loss_clipped = (v_clipped - mb.returns) ** 2
+        v_loss_max = torch.max(v_loss_unclipped, v_loss_clipped)
+        v_loss = 0.5 * v_loss_max.mean()
+    else:
+        v_loss = 0.5 * ((newvalue - mb.returns) ** 2).mean()
+
+    entropy_loss = entropy.mean()
+    loss = pg_loss - ent_coef * entropy_loss + v_loss * vf_coef
+
+    # http://joschu.net/blog/kl-approx.html
+    old_approx_kl = (-logratio).mean()
+    approx_kl = ((ratio - 1) - logratio).mean()
+    clipfrac = ((ratio - 1.0).abs() > clip_coef).float().mean()
+    return loss, torch.stack((pg_loss, v_loss, entropy_loss, old_approx_kl, approx_kl, clipfrac)).detach()
+
+
+@torch.no_grad()
+def relabel_logprobs(agent, storage, chunk_size):
+    """Overwrite `storage.logprobs` with the stored actions' log-probs under the agent's current weights."""
+    obs, actions, logprobs = storage.obs.flatten(0, 1), storage.actions.flatten(0, 1), storage.logprobs.view(-1)
+    for start in range(0, len(logprobs), chunk_size):
+        end = start + chunk_size
+        _, logprobs[start:end], _, _ = agent.get_action_and_value(obs[start:end].float(), actions[start:end].long())
+
+
+def explained_variance(values, returns):
+    # 0 rather than NaN for constant returns: the value is summed on device by MetricsAccumulator,
+    # where one NaN would poison the whole logged window
+    var_y = returns.var(correction=0)
+    return torch.where(var_y == 0, 0.0, 1 - (returns - values).var(correction=0) / var_y)
+
+
+def next_update_epochs(approx_kl, epochs_done, target_kl, max_epochs):
+    """Epochs for the next update: as many as this update's KL per epoch fits into `target_kl`."""
+    kl_per_epoch = approx_kl / epochs_done
+    if kl_per_epoch <= 0:
+        return max_epochs
+    return int(min(max(target_kl / kl_per_epoch, 1), max_epochs))
+
+
+def optimizer_step(agent, optimizer, max_grad_norm: float):
+    nn.utils.clip_grad_norm_(agent.parameters(), max_grad_norm)
+    optimizer.step()
+
+
+def set_learning_rate(optimizer, lr):
+    # compiled optimizer steps keep the learning rate in a tensor so annealing doesn't recompile
+    for group in optimizer.param_groups:
+        if isinstance(group["lr"], torch.Tensor):
+            group["lr"].fill_(lr)
+        else:
+            group["lr"] = lr
+
+
+def compile_with_fallback(fn):
+    """
+    `torch.compile` `fn`, running it eagerly from then on if compiling fails.
+
+    Compilation is lazy, so failures (a missing C compiler, an unsupported op)
+    only show up on the first call, or on a later recompile for a new shape.
+    """
+    compiled = torch.compile(fn)
+
+    def call(*args, **kwargs):
+        nonlocal compiled
+        try:
+            return compiled(*args, **kwargs)
+        except Exception as error:
+            if compiled is fn:
+                raise
+            warnings.warn(f"torch.compile failed, falling back to eager mode: {error}")
+            compiled = fn
+            return fn(*args, **kwargs)
+
+    return call
+
+
+if __name__ == "__main__":
+    # per-update timing, eager vs compiled: python ppo_update.py
+    import copy
+
+    import torch.optim as optim
+
+    from LevelTwoVecEnv import LevelTwoVecEnv
+    from RolloutBuffer import RolloutBuffer
+    from ppo import Agent
+
+    torch.manual_seed(0)
+    envs = LevelTwoVecEnv(num_envs=16)
+    buffer = RolloutBuffer.from_envs(128, envs, "cpu")
+    buffer.obs.uniform_()
+    buffer.actions.random_(0, envs.single_action_space.n)
+    buffer.logprobs.uniform_(-2.0, 0.0)
+    buffer.advantages.normal_()
+    buffer.returns.normal_()
+    buffer.values.normal_()
+    loss_kwargs = dict(clip_coef=0.2, norm_adv=True, clip_vloss=True, ent_coef=0.02, vf_coef=0.5)
+
+    agent = Agent(envs)
+    for name in ["eager", "compiled"]:
+        model = copy.deepcopy(agent)
+        optimizer = optim.Adam(model.parameters(), lr=1e-4, eps=1e-5)
+        loss_fn, step_fn = ppo_loss, optimizer_step
+        if name == "compiled":
+            set_learning_rate(optimizer, torch.tensor(1e-4))
+            loss_fn, step_fn = compile_with_fallback(ppo_loss), compile_with_fallback(optimizer_step)
+
+        def update(mb):
+            loss, *_ = loss_fn(model, mb, **loss_kwargs)
+            optimizer.zero_grad()
+            loss.backward()
+            step_fn(model, optimizer, 0.5)
+
+        # the first epoch pays for compilation
+        start = time.perf_counter()
+        for mb in buffer.minibatches(512):
+            update(mb)
+        warmup = time.perf_counter() - start
+
+        updates = 0
+        start = time.perf_counter()
+        for _ in range(20):
+            for mb in buffer.minibatches(512):
+                update(mb)
+                updates += 1
+        print(f"{name}: {(time.perf_counter() - start) / updates * 1e3:.2f}ms per update, first epoch {warmup:.1f}s")
@@ -2,7 +2,10 @@ import torch
 from LevelOneEnv import LevelOneEnv
 import numpy as np
 import gymnasium as gym
-from ppo import Actor, Args, make_env
+from ImageEncoder import ImageEncoder
+from ppo import Actor, Args
+from ppo_envs import make_env
+from RunningMeanStd import RunningMeanStd
 import tyro
 from torch.distributions.categorical import Categorical
 
@@ -22,13 +25,18 @@ class OnnxableAgent(torch.nn.Module):
 args = tyro.cli(Args)
 device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
 
-agent = Actor(gym.vector.SyncVectorEnv([make_env(args.env_id, i, False, '') for i in range(args.num_envs)])).to(device)
-agent.load_state_dict(torch.load("models/leveltwo/actor.pth"))
+envs = gym.vector.SyncVectorEnv([make_env(args.env_id, i, False, '') for i in range(args.num_envs)])
+# with --norm-obs the observation statistics are part of the actor, so the graph normalizes its own input
+obs_rms = RunningMeanStd(envs.single_observation_space.shape) if args.norm_obs else None
+encoder = ImageEncoder(envs.single_observation_space.shape[0]) if args.encoder == "cnn" else None
+agent = Actor(envs, obs_rms, encoder).to(device)
+# e.g. --actor-path models/leveltwo/actor.pth, or an actor trained on --env-id DynamicObstacles-Symbolic
+agent.load_state_dict(torch.load(args.actor_path))
 
 onnx_agent = OnnxableAgent(agent)
 
-distance = np.linalg.norm(np.array([0, 0]) - np.array([1, 1]))
-dummy_input = torch.Tensor([0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 1, distance]).unsqueeze(0)
+# any real observation of the env fixes the input width (14 for LevelTwo, 16 for DynamicObstacles-Symbolic)
+dummy_input = torch.as_tensor(envs.reset(seed=args.seed)[0][:1], dtype=torch.float32, device=device)
 
 torch.onnx.export(
     onnx_agent,